@@ -0,0 +1,84 @@
+"""
+Micro-benchmark for edit_document on a large document.
+
+A 10 MB document of numbered paragraphs receives 1,000 edits, each renaming
+one paragraph's heading, applied three ways:
+
+- str.replace on the whole text, as the server used to do
+- the piece-table store, replacing every match
+- the piece-table store, replacing the first match only
+- the same, with every edit written to the journal and synced to disk
+
+Run with: uv run python benchmark.py
+"""
+
+import random
+import tempfile
+import time
+
+from document_store import DocumentStore
+
+DOC_SIZE = 10 * 1024 * 1024
+EDITS = 1_000
+
+
+def make_document() -> str:
+    paragraph = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor "
+    lines = []
+    size = 0
+    while size < DOC_SIZE:
+        line = f"Paragraph {len(lines):06d}: {paragraph}\n"
+        lines.append(line)
+        size += len(line)
+    return "".join(lines)
+
+
+def make_edits(paragraphs: int) -> list[tuple[str, str]]:
+    rng = random.Random(0)
+    return [
+        (f"Paragraph {number:06d}:", f"Section {number:06d}:")
+        for number in rng.sample(range(paragraphs), EDITS)
+    ]
+
+
+def bench_str(text: str, edits: list[tuple[str, str]]) -> float:
+    start = time.perf_counter()
+    for old, new in edits:
+        text = text.replace(old, new)
+    return time.perf_counter() - start
+
+
+def bench_store(
+    text: str, edits: list[tuple[str, str]], first_only: bool, journal: bool = False
+) -> tuple[float, int]:
+    with tempfile.TemporaryDirectory() as directory:
+        store = DocumentStore(directory, journal=journal)
+        store.seed({"big.txt": text})
+        start = time.perf_counter()
+        for old, new in edits:
+            store.replace("big.txt", old, new, first_only)
+        elapsed = time.perf_counter() - start
+        pieces = len(store._table("big.txt").pieces)
+        store.close()
+    return elapsed, pieces
+
+
+def main():
+    text = make_document()
+    edits = make_edits(text.count("\n"))
+    print(f"{EDITS} edits on a {len(text) / 1024 / 1024:.0f} MB document")
+    print(f"{'method':>24} {'total s':>8} {'ms/edit':>8} {'pieces':>7}")
+
+    elapsed = bench_str(text, edits)
+    print(f"{'str.replace':>24} {elapsed:>8.2f} {elapsed / EDITS * 1e3:>8.2f} {'-':>7}")
+    for name, first_only, journal in (
+        ("piece table, all", False, False),
+        ("piece table, first only", True, False),
+        ("first only + journal", True, True),
+    ):
+        elapsed, pieces = bench_store(text, edits, first_only, journal)
+        print(f"{name:>24} {elapsed:>8.2f} {elapsed / EDITS * 1e3:>8.2f} {pieces:>7}")
+
+
+if __name__ == "__main__":
+    main()
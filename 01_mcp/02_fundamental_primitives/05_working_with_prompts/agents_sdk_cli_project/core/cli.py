@@ -8,7 +8,10 @@ from prompt_toolkit.auto_suggest import AutoSuggest, Suggestion
 from prompt_toolkit.document import Document
 from prompt_toolkit.buffer import Buffer
 
-from core.cli_chat import CliChat
+from core.cli_chat import CliChat, docs_listing_uri
+
+# Number of doc ids loaded for @mention completions
+COMPLETION_LIMIT = 1000
 
 
 class CommandAutoSuggest(AutoSuggest):
@@ -181,10 +184,17 @@ class CliApp:
     async def initialize(self):
         await self.refresh_resources()
         await self.refresh_prompts()
+        # Refresh the @mention completions only when the document list changes
+        self.agent.doc_client.on_resource_updated(self._on_resource_updated)
+
+    async def _on_resource_updated(self, uri: str):
+        if uri == docs_listing_uri(limit=COMPLETION_LIMIT):
+            await self.refresh_resources()
 
     async def refresh_resources(self):
         try:
-            self.resources = await self.agent.list_docs_ids()
+            # Completions offer the first ids of the listing, not the whole store
+            self.resources = await self.agent.list_docs_ids(limit=COMPLETION_LIMIT)
             self.completer.update_resources(self.resources)
         except Exception as e:
             print(f"Error refreshing resources: {e}")
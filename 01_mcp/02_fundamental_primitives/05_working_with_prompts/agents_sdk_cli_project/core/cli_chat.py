@@ -1,3 +1,6 @@
+from urllib.parse import urlencode
+
+from mcp.shared.exceptions import McpError
 from mcp.types import Prompt, PromptMessage
 
 from core.chat import Chat
@@ -5,6 +8,10 @@ from core.agent_service import AgentService
 from mcp_client import MCPClient
 
 
+def docs_listing_uri(prefix: str = "", limit: int = 100) -> str:
+    return f"docs://documents?{urlencode({'prefix': prefix, 'limit': limit})}"
+
+
 class CliChat(Chat):
     def __init__(
         self,
@@ -32,11 +39,12 @@ class CliChat(Chat):
     async def list_prompts(self) -> list[Prompt]:
         return await self.doc_client.list_prompts()
 
-    async def list_docs_ids(self) -> list[str]:
-        resource = await self.doc_client.read_resource("docs://documents")
-        # The docs://documents resource returns a JSON list
-        if isinstance(resource, list):
-            return resource
+    async def list_docs_ids(self, prefix: str = "", limit: int = 100) -> list[str]:
+        # Ask for one page of the listing only: the store may hold far more ids
+        resource = await self.doc_client.read_resource(docs_listing_uri(prefix, limit))
+        # The paginated listing returns {"ids": [...], "nextCursor": ...}
+        if isinstance(resource, dict):
+            return resource.get("ids", [])
         return []
 
     async def get_doc_content(self, doc_id: str) -> str:
@@ -54,13 +62,19 @@ class CliChat(Chat):
     async def _extract_resources(self, query: str) -> str:
         mentions = [word[1:] for word in query.split() if word.startswith("@")]
 
-        doc_ids = await self.list_docs_ids()
         mentioned_docs: list[tuple[str, str]] = []
 
-        for doc_id in doc_ids:
-            if doc_id in mentions:
+        for doc_id in dict.fromkeys(mentions):
+            # Anything with a "/" would address a range of a document, not a document
+            if not doc_id or any(character in doc_id for character in "/?#"):
+                continue
+            # Reading the document directly keeps one cache entry per document,
+            # and a mention of a missing one is simply left out
+            try:
                 content = await self.get_doc_content(doc_id)
-                mentioned_docs.append((doc_id, content))
+            except McpError:
+                continue
+            mentioned_docs.append((doc_id, content))
 
         return "".join(
             f'\n<document id="{doc_id}">\n{content}\n</document>\n'
@@ -109,6 +123,20 @@ class CliChat(Chat):
         self.agent_serve.messages.append({"role": "user", "content": prompt})
 
 
+def embedded_resource_text(content) -> str:
+    # Embedded documents are passed to the model the same way @mentions are
+    resource = (
+        content.get("resource", {})
+        if isinstance(content, dict)
+        else getattr(content, "resource", None)
+    )
+    if isinstance(resource, dict):
+        uri, text = resource.get("uri", ""), resource.get("text", "")
+    else:
+        uri, text = getattr(resource, "uri", ""), getattr(resource, "text", "")
+    return f'<document uri="{uri}">\n{text}\n</document>'
+
+
 def convert_prompt_message_to_message_param(
     prompt_message: "PromptMessage",
 ) -> dict:
@@ -130,6 +158,8 @@ def convert_prompt_message_to_message_param(
                 else getattr(content, "text", "")
             )
             return {"role": role, "content": content_text}
+        if content_type == "resource":
+            return {"role": role, "content": embedded_resource_text(content)}
 
     if isinstance(content, list):
         text_blocks = []
@@ -148,6 +178,10 @@ def convert_prompt_message_to_message_param(
                         else getattr(item, "text", "")
                     )
                     text_blocks.append({"type": "text", "text": item_text})
+                elif item_type == "resource":
+                    text_blocks.append(
+                        {"type": "text", "text": embedded_resource_text(item)}
+                    )
 
         if text_blocks:
             return {"role": role, "content": text_blocks}
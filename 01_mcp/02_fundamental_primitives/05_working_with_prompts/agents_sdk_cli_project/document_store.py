@@ -0,0 +1,568 @@
+"""
+Disk-backed document store for the DocumentMCP server.
+
+Each document is a UTF-8 file in the store's directory and is read through a
+memory map, so the server's heap does not grow with the corpus: only the
+pages a request touches are loaded, and the OS can drop them again. Edits
+are kept in a piece table over the mapped file and written back once the
+table grows large, or when the store is closed.
+
+Every edit is also appended to a journal before it is acknowledged. When the
+store is opened again, the edits the files do not hold yet are replayed, so
+a restart, or a crash, loses nothing. The document files are the snapshots
+the journal builds on. Once the journal grows past `max_journal_bytes`,
+every edited document is written back and the journal is compacted, so
+replay stays short however many edits were made.
+"""
+
+import hashlib
+import mmap
+import os
+import re
+import threading
+from bisect import bisect_left, bisect_right
+from itertools import takewhile
+from pathlib import Path
+from contextlib import ExitStack
+from typing import Callable, Iterable, NamedTuple
+
+from journal import EditJournal, JournalEdit
+from piece_table import PieceTable
+
+# Bytes that cannot be part of a word; UTF-8 multi-byte sequences count as word bytes
+NON_WORD = re.compile(rb"[^0-9A-Za-z_\x80-\xff]")
+# Bytes read at a time while looking for the word boundary around an edit
+CONTEXT_STEP = 64
+
+# Called with the doc id, then the text regions an edit replaced and what replaced them
+EditListener = Callable[[str, list[bytes], list[bytes]], None]
+
+
+def _file_version(stat: os.stat_result) -> str:
+    # A written-back file is a new inode, so its version differs even if its
+    # modification time and size happen to match the old one's
+    return f"{stat.st_ino:x}.{stat.st_mtime_ns:x}.{stat.st_size:x}"
+
+
+def _word_start(table: PieceTable, offset: int) -> int:
+    while offset > 0:
+        start = max(0, offset - CONTEXT_STEP)
+        boundary = NON_WORD.search(table.read(start, offset - start)[::-1])
+        if boundary:
+            return offset - boundary.start()
+        offset = start
+    return 0
+
+
+def _word_end(table: PieceTable, offset: int) -> int:
+    while offset < len(table):
+        window = table.read(offset, CONTEXT_STEP)
+        boundary = NON_WORD.search(window)
+        if boundary:
+            return offset + boundary.start()
+        offset += len(window)
+    return len(table)
+
+
+def _whole_characters(data: bytes) -> int:
+    """Return the length of `data` without a UTF-8 character cut off at its end."""
+    # A character is at most 4 bytes, so its lead byte is among the last 4
+    for back in range(1, min(4, len(data)) + 1):
+        byte = data[-back]
+        if byte & 0xC0 == 0x80:
+            continue
+        needed = 4 if byte >= 0xF0 else 3 if byte >= 0xE0 else 2 if byte >= 0xC0 else 1
+        return len(data) - back if back < needed else len(data)
+    return len(data)
+
+
+def _edit_regions(
+    table: PieceTable, matches: list[int], old_length: int, new: bytes
+) -> tuple[list[bytes], list[bytes]]:
+    """Return the text around each match, widened to whole words, before and after the edit."""
+    regions: list[tuple[int, int, list[int]]] = []
+    for match in matches:
+        start, end = _word_start(table, match), _word_end(table, match + old_length)
+        if regions and start <= regions[-1][1]:
+            regions[-1] = (regions[-1][0], end, regions[-1][2] + [match])
+        else:
+            regions.append((start, end, [match]))
+
+    removed, added = [], []
+    for start, end, region_matches in regions:
+        before = table.read(start, end - start)
+        parts, kept_from = [], start
+        for match in region_matches:
+            parts += [before[kept_from - start : match - start], new]
+            kept_from = match + old_length
+        parts.append(before[kept_from - start :])
+        removed.append(before)
+        added.append(b"".join(parts))
+    return removed, added
+
+
+class Snapshot(NamedTuple):
+    """A document's content and version at one point in time."""
+
+    table: PieceTable
+    version: str
+
+
+class DocumentStore:
+    """
+    A directory of documents, addressed by file name.
+
+    Offsets and lengths are in bytes of UTF-8 text; a range that cuts a
+    multi-byte character in half decodes it as U+FFFD. Lines are counted
+    from 1 and line ranges include both ends.
+
+    Every document has a version string that changes whenever its content
+    does: the inode, modification time and size of its file, plus the number
+    of edits made since the file was last written.
+
+    The store is safe to use from several threads. Writers take a lock per
+    document. Readers never wait for them: every write publishes a snapshot
+    of the document, which shares its memory with the working copy, and reads
+    go to the latest snapshot.
+    """
+
+    def __init__(
+        self,
+        directory: str | Path,
+        max_pieces: int = 256,
+        journal: bool = True,
+        sync: bool = True,
+        max_journal_bytes: int = 4 * 1024 * 1024,
+    ):
+        """Open the store and replay the edits its files do not hold yet.
+
+        Args:
+            directory: Directory holding one file per document
+            max_pieces: Piece count at which an edited document is written back
+            journal: Record edits in the `.journal` file of the directory
+            sync: Flush every journal record to disk before the edit returns
+            max_journal_bytes: Journal size at which edits are written back
+                and the journal is compacted
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_pieces = max_pieces
+        # working copy of each open document, only touched under its lock
+        self._tables: dict[str, PieceTable] = {}
+        # latest snapshot of each open document, read without locking
+        self._snapshots: dict[str, Snapshot] = {}
+        self._locks: dict[str, threading.RLock] = {}
+        self._locks_lock = threading.Lock()
+        # documents with edits that are not written back yet
+        self._dirty: set[str] = set()
+        # doc id -> (version of the mapped file, edits made since)
+        self._versions: dict[str, tuple[str, int]] = {}
+        self._edit_listeners: list[EditListener] = []
+        # (directory mtime, sorted doc ids, their version) as of the last listing
+        self._listing: tuple[int, list[str], str] | None = None
+        self.max_journal_bytes = max_journal_bytes
+        self._sync = sync and journal
+        self._checkpoint_lock = threading.Lock()
+        self._journal: EditJournal | None = None
+        if journal:
+            self._journal = EditJournal(self.directory / ".journal", sync)
+            self._replay()
+
+    def seed(self, documents: dict[str, str]) -> None:
+        """Write the given documents if the store is still empty."""
+        if self.ids():
+            return
+        for doc_id, content in documents.items():
+            self._write(doc_id, [content.encode()])
+
+    def on_edit(self, listener: EditListener) -> None:
+        """Call `listener` after every edit with the regions of text it changed."""
+        self._edit_listeners.append(listener)
+
+    def _path(self, doc_id: str) -> Path:
+        if not doc_id or doc_id.startswith(".") or "/" in doc_id or "\\" in doc_id:
+            raise ValueError(f"Invalid doc id {doc_id!r}")
+        return self.directory / doc_id
+
+    def listing_version(self) -> str:
+        """Return a version that changes whenever a document is added or removed."""
+        self._sorted_ids()
+        return self._listing[2]
+
+    def _sorted_ids(self) -> list[str]:
+        # The directory is only listed again once an entry in it has changed
+        mtime = self.directory.stat().st_mtime_ns
+        if self._listing is None or self._listing[0] != mtime:
+            ids = sorted(
+                path.name
+                for path in self.directory.iterdir()
+                if path.is_file() and not path.name.startswith(".")
+            )
+            # Writing a document back also changes the directory's mtime, so
+            # the version is taken from the ids themselves
+            version = hashlib.blake2b("\0".join(ids).encode(), digest_size=8).hexdigest()
+            self._listing = (mtime, ids, version)
+        return self._listing[1]
+
+    def ids(self, prefix: str = "", after: str | None = None, limit: int | None = None) -> list[str]:
+        """Return the sorted doc ids starting with `prefix`.
+
+        Args:
+            prefix: Only return ids starting with this text
+            after: Only return ids sorting after this one, to continue a listing
+            limit: Maximum number of ids to return
+        """
+        ids = self._sorted_ids()
+        start = bisect_left(ids, prefix)
+        if after is not None:
+            start = max(start, bisect_right(ids, after))
+        end = len(ids) if limit is None else start + limit
+        return list(takewhile(lambda doc_id: doc_id.startswith(prefix), ids[start:end]))
+
+    def __contains__(self, doc_id: str) -> bool:
+        try:
+            return self._path(doc_id).is_file()
+        except ValueError:
+            return False
+
+    def write_lock(self, doc_id: str) -> threading.RLock:
+        """Return the lock held while a document is edited; holding it keeps the document unchanged."""
+        with self._locks_lock:
+            return self._locks.setdefault(doc_id, threading.RLock())
+
+    def _table(self, doc_id: str) -> PieceTable:
+        """Return the working copy of a document, mapping its file on first use.
+
+        Must be called with the document's lock held.
+        """
+        table = self._tables.get(doc_id)
+        if table is None:
+            if doc_id not in self:
+                raise ValueError(f"Doc with id {doc_id} not found")
+            with open(self._path(doc_id), "rb") as file:
+                stat = os.fstat(file.fileno())
+                self._versions[doc_id] = (_file_version(stat), 0)
+                # Empty files cannot be memory-mapped
+                if stat.st_size == 0:
+                    table = PieceTable()
+                else:
+                    table = PieceTable(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+            self._tables[doc_id] = table
+            self._publish(doc_id)
+        return table
+
+    def _publish(self, doc_id: str) -> None:
+        file_version, edits = self._versions[doc_id]
+        self._snapshots[doc_id] = Snapshot(
+            self._tables[doc_id].snapshot(), f"{file_version}.{edits}"
+        )
+
+    def snapshot(self, doc_id: str) -> Snapshot:
+        """Return the latest snapshot of a document; later edits do not change it."""
+        snapshot = self._snapshots.get(doc_id)
+        if snapshot is None:
+            with self.write_lock(doc_id):
+                self._table(doc_id)
+                snapshot = self._snapshots[doc_id]
+        return snapshot
+
+    def version(self, doc_id: str) -> str:
+        """Return the current version of a document."""
+        return self.snapshot(doc_id).version
+
+    def size(self, doc_id: str) -> int:
+        """Return the size of a document in bytes."""
+        return len(self.snapshot(doc_id).table)
+
+    def read(self, doc_id: str, offset: int = 0, length: int | None = None) -> str:
+        """Read `length` bytes of a document starting at `offset` (to the end by default)."""
+        if offset < 0 or (length is not None and length < 0):
+            raise ValueError("offset and length must not be negative")
+        return self.snapshot(doc_id).table.read(offset, length).decode(errors="replace")
+
+    def read_range(self, snapshot: Snapshot, offset: int, length: int) -> tuple[str, int]:
+        """Read up to `length` bytes of a snapshot from `offset`, ending on a whole character.
+
+        Returns the text and the offset it ends at, where the next range
+        starts. A character cut at the end of the range is left to that range.
+        """
+        if offset < 0 or length < 0:
+            raise ValueError("offset and length must not be negative")
+        table = snapshot.table
+        data = table.read(offset, length)
+        if offset + len(data) < len(table):
+            # Unless the range is too short to hold even one character
+            data = data[: _whole_characters(data) or len(data)]
+        return data.decode(errors="replace"), offset + len(data)
+
+    def read_lines(self, doc_id: str, start_line: int, end_line: int | None = None) -> str:
+        """Read lines `start_line` to `end_line` of a document (to the end by default)."""
+        if start_line < 1 or (end_line is not None and end_line < start_line):
+            raise ValueError("Lines are counted from 1 and end_line must not precede start_line")
+        table = self.snapshot(doc_id).table
+        line_starts = table.line_starts()
+        start = line_starts[start_line - 1] if start_line <= len(line_starts) else len(table)
+        end = len(table)
+        if end_line is not None and end_line < len(line_starts):
+            end = line_starts[end_line]
+        return table.read(start, end - start).decode(errors="replace")
+
+    def _check_version(self, doc_id: str, expected_version: str | None) -> None:
+        if expected_version is None:
+            return
+        self._table(doc_id)
+        file_version, edits = self._versions[doc_id]
+        version = f"{file_version}.{edits}"
+        if version != expected_version:
+            raise ValueError(
+                f"Doc with id {doc_id} changed: it is at version {version}, not "
+                f"{expected_version}. Read it again before editing."
+            )
+
+    def _replace(
+        self, doc_id: str, old: str, new: str, first_only: bool
+    ) -> tuple[int, tuple[list[bytes], list[bytes]]]:
+        """Edit the working copy of a document, without publishing it.
+
+        Returns the number of matches replaced and the regions the edit changed.
+        """
+        if not old:
+            raise ValueError("The text to replace must not be empty")
+        table = self._table(doc_id)
+        old_bytes, new_bytes = old.encode(), new.encode()
+        matches = table.find(old_bytes, first_only)
+        if not matches:
+            return 0, ([], [])
+        regions = ([], [])
+        if self._edit_listeners:
+            regions = _edit_regions(table, matches, len(old_bytes), new_bytes)
+        table.replace_matches(matches, len(old_bytes), new_bytes)
+
+        self._dirty.add(doc_id)
+        file_version, edits = self._versions[doc_id]
+        self._versions[doc_id] = (file_version, edits + 1)
+        return len(matches), regions
+
+    def _commit(self, doc_id: str, regions: tuple[list[bytes], list[bytes]]) -> None:
+        """Publish an edited document, notify listeners and write it back if it grew large."""
+        self._publish(doc_id)
+        for listener in self._edit_listeners:
+            listener(doc_id, *regions)
+        if len(self._tables[doc_id].pieces) > self.max_pieces:
+            self.flush(doc_id)
+
+    def replace(
+        self,
+        doc_id: str,
+        old: str,
+        new: str,
+        first_only: bool = False,
+        expected_version: str | None = None,
+    ) -> int:
+        """Replace occurrences of `old` in a document; returns how many were replaced.
+
+        With `expected_version`, the edit is refused with ValueError unless the
+        document is still at that version.
+        """
+        with self.write_lock(doc_id):
+            self._check_version(doc_id, expected_version)
+            saved = self._save(doc_id)
+            replaced, regions = self._replace(doc_id, old, new, first_only)
+            if replaced:
+                file_version = saved[1][0]
+                try:
+                    self._log([JournalEdit(doc_id, file_version, old, new, first_only)])
+                except Exception:
+                    # An edit the journal does not hold must not stay in the document
+                    self._restore(doc_id, saved)
+                    raise
+                self._commit(doc_id, regions)
+        self._checkpoint_if_large()
+        return replaced
+
+    def replace_many(
+        self,
+        edits: list[tuple[str, str, str, bool]],
+        expected_versions: dict[str, str] | None = None,
+    ) -> list[int]:
+        """Apply (doc id, old, new, first only) replacements in order, all or none.
+
+        Returns how many matches each edit replaced. If a document is missing,
+        is not at its version in `expected_versions`, or an edit matches
+        nothing, every edit is undone and ValueError names the edit that failed.
+        Readers see either none of the edits or all of them.
+        """
+        doc_ids = sorted({doc_id for doc_id, *_ in edits if doc_id in self})
+        with ExitStack() as stack:
+            # Locks are always taken in the same order, so batches cannot deadlock
+            for doc_id in doc_ids:
+                stack.enter_context(self.write_lock(doc_id))
+            for doc_id, version in (expected_versions or {}).items():
+                self._check_version(doc_id, version)
+
+            # doc id -> (piece table state, version, dirty) before its first edit
+            saved: dict[str, tuple[tuple, tuple[str, int], bool]] = {}
+            changes: dict[str, tuple[list[bytes], list[bytes]]] = {}
+            counts: list[int] = []
+            try:
+                for number, (doc_id, old, new, first_only) in enumerate(edits, 1):
+                    try:
+                        if doc_id not in doc_ids:
+                            raise ValueError(f"Doc with id {doc_id} not found")
+                        if doc_id not in saved:
+                            saved[doc_id] = self._save(doc_id)
+                        replaced, regions = self._replace(doc_id, old, new, first_only)
+                    except ValueError as e:
+                        raise ValueError(f"Edit {number} failed: {e}") from e
+                    if not replaced:
+                        raise ValueError(
+                            f"Edit {number} failed: no matches for the text to replace in document {doc_id}"
+                        )
+                    counts.append(replaced)
+                    removed, added = changes.setdefault(doc_id, ([], []))
+                    removed += regions[0]
+                    added += regions[1]
+                self._log(
+                    [
+                        JournalEdit(doc_id, saved[doc_id][1][0], old, new, first_only)
+                        for doc_id, old, new, first_only in edits
+                    ]
+                )
+            except Exception:
+                # A failed edit, or a batch the journal does not hold, is undone
+                for doc_id, state in saved.items():
+                    self._restore(doc_id, state)
+                raise
+
+            # Snapshots and listeners only see edits that were kept
+            for doc_id, regions in changes.items():
+                self._commit(doc_id, regions)
+        self._checkpoint_if_large()
+        return counts
+
+    def _save(self, doc_id: str) -> tuple[tuple, tuple[str, int], bool]:
+        """Return the piece table state, version and dirty flag that `_restore` puts back."""
+        table = self._table(doc_id)
+        return table.state(), self._versions[doc_id], doc_id in self._dirty
+
+    def _restore(self, doc_id: str, saved: tuple[tuple, tuple[str, int], bool]) -> None:
+        """Undo the edits made to a document since `_save`; they were never published."""
+        state, version, dirty = saved
+        self._tables[doc_id].restore(state)
+        self._versions[doc_id] = version
+        if not dirty:
+            self._dirty.discard(doc_id)
+
+    def _log(self, edits: list[JournalEdit]) -> None:
+        if self._journal is not None:
+            self._journal.append(edits)
+
+    def _replay(self) -> None:
+        """Apply the journaled edits made against the current version of each file."""
+        replayed = 0
+        for edits in self._journal.records():
+            for edit in edits:
+                if edit.doc_id not in self:
+                    continue
+                with self.write_lock(edit.doc_id):
+                    self._table(edit.doc_id)
+                    if self._versions[edit.doc_id][0] != edit.file_version:
+                        continue
+                    if self._replace(edit.doc_id, edit.old, edit.new, edit.first_only)[0]:
+                        self._publish(edit.doc_id)
+                        replayed += 1
+                    else:
+                        print(f"Journaled edit of {edit.doc_id} no longer matches; skipped")
+        if replayed:
+            print(f"Replayed {replayed} edits from the journal")
+        self._checkpoint_if_large()
+
+    def _is_current(self, edit: JournalEdit) -> bool:
+        try:
+            return _file_version(self._path(edit.doc_id).stat()) == edit.file_version
+        except (OSError, ValueError):
+            return False
+
+    def checkpoint(self) -> None:
+        """Write back every edited document and drop the journaled edits they now hold."""
+        if self._journal is None:
+            return
+        # Edits keep going meanwhile; the ones made after their document was
+        # written back refer to the new file and stay in the journal
+        for doc_id in list(self._dirty):
+            self.flush(doc_id)
+        self._journal.compact(self._is_current)
+
+    def _checkpoint_if_large(self) -> None:
+        if self._journal is None or self._journal.size <= self.max_journal_bytes:
+            return
+        # One checkpoint at a time; edits arriving meanwhile do not wait for it
+        if self._checkpoint_lock.acquire(blocking=False):
+            try:
+                self.checkpoint()
+            finally:
+                self._checkpoint_lock.release()
+
+    def flush(self, doc_id: str) -> None:
+        """Write a document's edits back to its file and start a fresh piece table."""
+        with self.write_lock(doc_id):
+            if self._write_back(doc_id) is None:
+                return
+            # The new file is mapped and published in place of the old
+            # snapshot, which readers keep using meanwhile: they never find
+            # a document without a snapshot and wait for this lock
+            self._table(doc_id)
+
+    def _write_back(self, doc_id: str) -> PieceTable | None:
+        """Write a document back if it was edited and close its working copy; returns the old table.
+
+        Must be called with the document's lock held. Readers may still hold
+        snapshots of the old file, which stays mapped until the last of them is gone.
+        """
+        table = self._tables.pop(doc_id, None)
+        if table is None:
+            return None
+        if doc_id in self._dirty:
+            self._write(doc_id, table.chunks())
+            self._dirty.discard(doc_id)
+        del self._versions[doc_id]
+        return table
+
+    def forget(self, doc_id: str) -> None:
+        """Drop the open copy of a document whose file was removed, unsaved edits included."""
+        with self.write_lock(doc_id):
+            self._tables.pop(doc_id, None)
+            self._dirty.discard(doc_id)
+            self._versions.pop(doc_id, None)
+            self._snapshots.pop(doc_id, None)
+
+    def _write(self, doc_id: str, chunks: Iterable[bytes]) -> None:
+        """Atomically replace a document's file with the given bytes."""
+        path = self._path(doc_id)
+        temporary = path.with_name(f".{doc_id}.tmp")
+        with open(temporary, "wb") as file:
+            file.writelines(chunks)
+            # The journal forgets edits once they are written back, so they
+            # must be on disk first
+            if self._sync:
+                file.flush()
+                os.fsync(file.fileno())
+        os.replace(temporary, path)
+        if self._sync:
+            # So is the rename, or a crash could bring back the old file
+            # after the journal has dropped the edits it lacks
+            directory = os.open(self.directory, os.O_RDONLY)
+            try:
+                os.fsync(directory)
+            finally:
+                os.close(directory)
+
+    def close(self) -> None:
+        """Write back all edited documents, empty the journal and release the memory maps."""
+        for doc_id in list(self._tables):
+            with self.write_lock(doc_id):
+                self._write_back(doc_id).close()
+                self._snapshots.pop(doc_id, None)
+        if self._journal is not None:
+            self._journal.compact(self._is_current)
+            self._journal.close()
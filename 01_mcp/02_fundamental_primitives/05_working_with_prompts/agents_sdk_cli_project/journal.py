@@ -0,0 +1,137 @@
+"""
+Append-only journal of the edits made to a DocumentMCP store.
+
+Edits live in memory until a document is written back, so the store records
+each one here first. A record holds the edits of one `replace` or
+`replace_many` call, framed by its length and a CRC-32 so that a record torn
+by a crash is detected and dropped. Every edit carries the version of the
+document's file it was made against; once the file is rewritten, its older
+edits no longer apply and are skipped on replay or dropped by `compact`.
+"""
+
+import os
+import struct
+import threading
+import zlib
+from pathlib import Path
+from typing import Callable, Iterator, NamedTuple
+
+# Record header: payload length and CRC-32 of the payload
+HEADER = struct.Struct("<II")
+LENGTH = struct.Struct("<I")
+
+
+class JournalEdit(NamedTuple):
+    doc_id: str
+    file_version: str
+    old: str
+    new: str
+    first_only: bool
+
+
+def _pack_text(text: str) -> bytes:
+    data = text.encode()
+    return LENGTH.pack(len(data)) + data
+
+
+def _unpack_text(payload: bytes, offset: int) -> tuple[str, int]:
+    (length,) = LENGTH.unpack_from(payload, offset)
+    offset += LENGTH.size
+    return payload[offset : offset + length].decode(), offset + length
+
+
+def encode(edits: list[JournalEdit]) -> bytes:
+    payload = bytearray(LENGTH.pack(len(edits)))
+    for edit in edits:
+        for text in (edit.doc_id, edit.file_version, edit.old, edit.new):
+            payload += _pack_text(text)
+        payload.append(edit.first_only)
+    return HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def decode(payload: bytes) -> list[JournalEdit]:
+    (count,) = LENGTH.unpack_from(payload)
+    offset = LENGTH.size
+    edits = []
+    for _ in range(count):
+        doc_id, offset = _unpack_text(payload, offset)
+        file_version, offset = _unpack_text(payload, offset)
+        old, offset = _unpack_text(payload, offset)
+        new, offset = _unpack_text(payload, offset)
+        edits.append(JournalEdit(doc_id, file_version, old, new, bool(payload[offset])))
+        offset += 1
+    return edits
+
+
+def scan(data: bytes) -> Iterator[tuple[int, int, bytes]]:
+    """Yield (start, end, payload) of each intact record, stopping at a torn one."""
+    offset = 0
+    while offset + HEADER.size <= len(data):
+        length, crc = HEADER.unpack_from(data, offset)
+        end = offset + HEADER.size + length
+        payload = data[offset + HEADER.size : end]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            return
+        yield offset, end, payload
+        offset = end
+
+
+class EditJournal:
+    """
+    The journal file of a store.
+
+    With `sync`, every record is flushed to disk before `append` returns, so
+    an acknowledged edit survives a crash of the machine, not just of the
+    process.
+    """
+
+    def __init__(self, path: str | Path, sync: bool = True):
+        self.path = Path(path)
+        self.sync = sync
+        self._lock = threading.Lock()
+        self._file = open(self.path, "ab")
+
+    @property
+    def size(self) -> int:
+        return self._file.tell()
+
+    def append(self, edits: list[JournalEdit]) -> None:
+        record = encode(edits)
+        with self._lock:
+            self._file.write(record)
+            self._file.flush()
+            if self.sync:
+                os.fsync(self._file.fileno())
+
+    def records(self) -> Iterator[list[JournalEdit]]:
+        """Yield the recorded edits in order, cutting off a torn record at the end."""
+        with self._lock, open(self.path, "rb") as file:
+            data = file.read()
+        offset = 0
+        for _, offset, payload in scan(data):
+            yield decode(payload)
+        if offset < len(data):
+            print(f"Dropping a torn record at the end of the journal ({len(data) - offset} bytes)")
+            with self._lock:
+                self._file.truncate(offset)
+
+    def compact(self, is_current: Callable[[JournalEdit], bool]) -> None:
+        """Rewrite the journal with only the edits for which `is_current` holds."""
+        with self._lock:
+            with open(self.path, "rb") as file:
+                data = file.read()
+            temporary = self.path.with_name(f"{self.path.name}.tmp")
+            with open(temporary, "wb") as file:
+                for start, end, payload in scan(data):
+                    # A batch is kept whole if any of its edits still applies
+                    if any(is_current(edit) for edit in decode(payload)):
+                        file.write(data[start:end])
+                file.flush()
+                os.fsync(file.fileno())
+            self._file.close()
+            os.replace(temporary, self.path)
+            self._file = open(self.path, "ab")
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
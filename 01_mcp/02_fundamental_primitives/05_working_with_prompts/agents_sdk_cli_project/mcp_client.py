@@ -2,20 +2,39 @@ import sys
 import asyncio
 import json
 from pydantic import AnyUrl
-from typing import Optional, Any
+from typing import Optional, Any, Awaitable, Callable
 from contextlib import AsyncExitStack
 from mcp import ClientSession, types
+from mcp.shared.exceptions import McpError
 from mcp.client.streamable_http import streamablehttp_client
 
 
+def is_document_uri(uri: str) -> bool:
+    """Whether a URI names a whole document, as opposed to a range or the listing."""
+    doc_id = uri.removeprefix("docs://")
+    return uri.startswith("docs://") and doc_id != "documents" and not any(c in doc_id for c in "/?")
+
+
 class MCPClient:
     def __init__(
         self,
         server_url: str,
+        chunk_size: int | None = 256 * 1024,
     ):
         self._server_url = server_url
+        # Documents are read in byte ranges of about this many bytes
+        self._chunk_size = chunk_size
         self._session: Optional[ClientSession] = None
         self._exit_stack: AsyncExitStack = AsyncExitStack()
+        # uri -> (version, parsed contents) of resources read before
+        self._resource_cache: dict[str, tuple[str | None, Any]] = {}
+        # Subscribed resources are only re-read after the server says they changed
+        self._can_subscribe = False
+        self._subscribed: set[str] = set()
+        self._fresh: set[str] = set()
+        self._update_counts: dict[str, int] = {}
+        self._resource_listeners: list[Callable[[str], Awaitable[None]]] = []
+        self._listener_tasks: set[asyncio.Task] = set()
 
     async def connect(self):
         streamable_transport = await self._exit_stack.enter_async_context(
@@ -23,9 +42,35 @@ class MCPClient:
         )
         _read, _write, _get_session_id = streamable_transport
         self._session = await self._exit_stack.enter_async_context(
-            ClientSession(_read, _write)
+            ClientSession(_read, _write, message_handler=self._handle_message)
         )
-        await self._session.initialize()
+        result = await self._session.initialize()
+        resources = result.capabilities.resources
+        self._can_subscribe = bool(resources and resources.subscribe)
+
+    async def _handle_message(self, message) -> None:
+        # Server notifications keep the resource cache up to date
+        if not isinstance(message, types.ServerNotification):
+            return
+        notification = message.root
+        if isinstance(notification, types.ResourceUpdatedNotification):
+            uri = str(notification.params.uri)
+            self._fresh.discard(uri)
+            self._update_counts[uri] = self._update_counts.get(uri, 0) + 1
+            # Listeners may read resources, which needs this receive loop to
+            # stay free, so they run as tasks of their own
+            for listener in self._resource_listeners:
+                task = asyncio.create_task(listener(uri))
+                self._listener_tasks.add(task)
+                task.add_done_callback(self._listener_tasks.discard)
+        elif isinstance(notification, types.ResourceListChangedNotification):
+            # A document was added or removed; revalidate every cached copy,
+            # which costs a "not modified" reply for those that still exist
+            self._fresh.clear()
+
+    def on_resource_updated(self, listener: Callable[[str], Awaitable[None]]):
+        # Call `listener` with the URI of every updated resource read before
+        self._resource_listeners.append(listener)
 
     def session(self) -> ClientSession:
         if self._session is None:
@@ -60,16 +105,117 @@ class MCPClient:
         result = await self.session().get_prompt(prompt_name,args)
         return result.messages
 
-    async def read_resource(self, uri: str) -> Any:
-        # TODO: Read a resource, parse the contents and return it
-        result = await self.session().read_resource(AnyUrl(uri))
+    async def read_resource(
+        self,
+        uri: str,
+        on_chunk: Callable[[str, float, float | None], Awaitable[None]] | None = None,
+    ) -> Any:
+        # Read a resource, parse the contents and return it.
+        # Resources the server versions are cached: the request carries the
+        # cached version, and a "not modified" reply returns the cached copy.
+        # Subscribed resources are served from the cache until updated.
+        # Documents are read as consecutive byte ranges. With `on_chunk`,
+        # each range is passed to it with the bytes read so far and the
+        # total, and is not kept: the returned contents have empty text and
+        # nothing is cached, so memory stays at one range however large the
+        # document is.
+        if on_chunk is None and uri in self._fresh:
+            return self._resource_cache[uri][1]
+        if self._can_subscribe and uri not in self._subscribed:
+            # Subscribe before reading so no update in between is missed
+            await self.session().subscribe_resource(AnyUrl(uri))
+            self._subscribed.add(uri)
+        update_count = self._update_counts.get(uri, 0)
+
+        cached = self._resource_cache.get(uri) if on_chunk is None else None
+        request_meta: dict[str, Any] = {}
+        if cached and cached[0]:
+            request_meta["ifNoneMatch"] = cached[0]
+
+        try:
+            if self._chunk_size and is_document_uri(uri):
+                result = await self._read_ranges(uri, request_meta, on_chunk)
+            else:
+                result = await self._read(uri, request_meta)
+        except McpError:
+            # The resource is gone (or unreadable), so the cached copy and
+            # the subscription are too
+            self._resource_cache.pop(uri, None)
+            self._fresh.discard(uri)
+            if uri in self._subscribed:
+                self._subscribed.discard(uri)
+                await self.session().unsubscribe_resource(AnyUrl(uri))
+            raise
         resource = result.contents[0]
+        meta = resource.meta or {}
+        if cached and meta.get("notModified"):
+            contents = cached[1]
+        else:
+            contents = resource
+            if isinstance(resource, types.TextResourceContents):
+                if resource.mimeType == "application/json":
+                    contents = json.loads(resource.text)
+
+        if on_chunk is not None:
+            return contents
+        if uri in self._subscribed or "version" in meta:
+            self._resource_cache[uri] = (meta.get("version"), contents)
+        # Unless an update arrived while reading, the copy stays current
+        if uri in self._subscribed and self._update_counts.get(uri, 0) == update_count:
+            self._fresh.add(uri)
+        return contents
+
+    async def _read(self, uri: str, request_meta: dict[str, Any]) -> types.ReadResourceResult:
+        params = types.ReadResourceRequestParams(uri=AnyUrl(uri), _meta=request_meta or None)
+        return await self.session().send_request(
+            types.ClientRequest(types.ReadResourceRequest(method="resources/read", params=params)),
+            types.ReadResourceResult,
+        )
 
-        if isinstance(resource, types.TextResourceContents):
-            if resource.mimeType == "application/json":
-                return json.loads(resource.text)
+    async def _read_ranges(
+        self,
+        uri: str,
+        request_meta: dict[str, Any],
+        on_chunk: Callable[[str, float, float | None], Awaitable[None]] | None,
+    ) -> types.ReadResourceResult:
+        # Each range reply says where its text ends, the document's size and
+        # the version it was read from; only the first carries `ifNoneMatch`
+        pieces: list[str] = []
+        offset = 0
+        version = None
+        while True:
+            result = await self._read(f"{uri}/bytes/{offset}/{self._chunk_size}", request_meta)
+            resource = result.contents[0]
+            meta = resource.meta or {}
+            if meta.get("notModified"):
+                return result
+            if version is None:
+                version = meta["version"]
+            elif meta["version"] != version:
+                if on_chunk is not None:
+                    raise RuntimeError(f"{uri} changed while it was being read; read it again")
+                # Nothing was handed out yet, so start over on the new version
+                pieces.clear()
+                offset, version = 0, None
+                continue
+            if meta["end"] <= offset < meta["size"]:
+                raise RuntimeError(f"Reading {uri} made no progress at byte {offset}")
+            offset = meta["end"]
+            if on_chunk is None:
+                pieces.append(resource.text)
+            else:
+                await on_chunk(resource.text, offset, meta["size"])
+            if offset >= meta["size"]:
+                break
+            request_meta = {}
 
-        return resource
+        return types.ReadResourceResult(
+            contents=[
+                types.TextResourceContents(
+                    uri=AnyUrl(uri), text="".join(pieces), mimeType="text/plain", _meta={"version": version}
+                )
+            ]
+        )
 
     async def cleanup(self):
         await self._exit_stack.aclose()
@@ -1,10 +1,27 @@
+import asyncio
+import json
+import os
+import re
+from contextlib import asynccontextmanager
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+import anyio
+from mcp import types
 from mcp.server.fastmcp import FastMCP
-from pydantic import Field
+from pydantic import BaseModel, Field
 from mcp.server.fastmcp.prompts import base
 
-mcp = FastMCP("DocumentMCP", log_level="ERROR", stateless_http=True)
+from document_store import DocumentStore, Snapshot
+from search_index import SearchIndex
+from subscriptions import ResourceSubscriptions
+
+# Stateful sessions let the server push resource notifications to clients
+mcp = FastMCP("DocumentMCP", log_level="ERROR", stateless_http=False)
+subscriptions = ResourceSubscriptions(mcp._mcp_server)
 
-docs = {
+# Documents written to the store the first time the server starts
+seed_docs = {
     "deposition.md": "This deposition covers the testimony of Angela Smith, P.E.",
     "report.pdf": "The report details the state of a 20m condenser tower.",
     "financials.docx": "These financials outline the project's budget and expenditures.",
@@ -13,38 +30,198 @@ docs = {
     "spec.txt": "These specifications define the technical requirements for the equipment.",
 }
 
+# Opened in the app's lifespan, not on import: uvicorn's reloader process
+# imports this module too, and must not replay the journal or write back
+# documents alongside the worker that serves requests
+docs: DocumentStore
+index: SearchIndex
+
+
+def open_documents() -> None:
+    global docs, index
+    docs = DocumentStore(os.getenv("DOCUMENTS_DIR", Path(__file__).parent / "documents"))
+    docs.seed(seed_docs)
+    index = SearchIndex(docs)
+    docs.on_edit(index.apply_edit)
+
+LISTING_URI = "docs://documents"
+# Default and largest number of doc ids in one page of the listing
+LISTING_PAGE_SIZE = 100
+MAX_LISTING_PAGE_SIZE = 1000
+
 
 @mcp.tool(
     name="read_doc_contents",
-    description="Read the contents of a document and return it as a string."
+    description=(
+        "Read the contents of a document and return it as a string. "
+        "Large documents can be read in parts, either by byte offset and length "
+        "or by a range of line numbers."
+    )
 )
-def read_document(
-    doc_id: str = Field(description="Id of the document to read")
+async def read_document(
+    doc_id: str = Field(description="Id of the document to read"),
+    offset: int | None = Field(
+        default=None, description="Byte offset to start reading at"),
+    length: int | None = Field(
+        default=None, description="Maximum number of bytes to read"),
+    start_line: int | None = Field(
+        default=None, description="First line to read, counting from 1"),
+    end_line: int | None = Field(
+        default=None, description="Last line to read, inclusive")
 ):
     print(f"Reading document tool called with {doc_id}...")
     if doc_id not in docs:
         raise ValueError(f"Doc with id {doc_id} not found")
 
-    return docs[doc_id]
+    # Like edits, reads run on a worker thread, so a large one or a document
+    # mapped for the first time does not hold up the event loop
+    if start_line is not None or end_line is not None:
+        if offset is not None or length is not None:
+            raise ValueError("Read either a byte range or a line range, not both")
+        return await anyio.to_thread.run_sync(docs.read_lines, doc_id, start_line or 1, end_line)
+    return await anyio.to_thread.run_sync(docs.read, doc_id, offset or 0, length)
 
 
 @mcp.tool(
     name="edit_document",
-    description="Edit a document by replacing a string in the documents content with a new string."
+    description=(
+        "Edit a document by replacing a string in the documents content with a new string. "
+        "Every match is replaced unless first_match_only is set; the result reports how many were "
+        "and the document's new version. Pass expected_version to edit only if nobody else has "
+        "changed the document since that version."
+    )
 )
-def edit_document(
+async def edit_document(
     doc_id: str = Field(description="Id of the document that will be edited"),
     old_str: str = Field(
         description="The text to replace. Must match exactly, including whitespace."),
     new_str: str = Field(
-        description="The new text to insert in place of the old text.")
+        description="The new text to insert in place of the old text."),
+    first_match_only: bool = Field(
+        default=False,
+        description="Replace only the first match instead of every match."),
+    expected_version: str | None = Field(
+        default=None,
+        description="Version the document must still be at, as reported by read_docs or a previous edit.")
 ):
     print(f"Editing document tool called with {doc_id}...")
     if doc_id not in docs:
         raise ValueError(f"Doc with id {doc_id} not found")
 
-    docs[doc_id] = docs[doc_id].replace(old_str, new_str)
-    return f"Successfully updated document {doc_id}"
+    # FastMCP runs tools on the event loop; the edit waits for its document's
+    # lock and the journal's fsync on a worker thread instead
+    replaced = await anyio.to_thread.run_sync(
+        docs.replace, doc_id, old_str, new_str, first_match_only, expected_version
+    )
+    if not replaced:
+        return f"No matches for the text to replace in document {doc_id}; nothing was changed"
+    subscriptions.notify_updated(lambda uri: doc_id_from_uri(uri) == doc_id)
+    return (
+        f"Successfully updated document {doc_id} "
+        f"({replaced} replacement{'s' if replaced != 1 else ''}, version {docs.version(doc_id)})"
+    )
+
+
+@mcp.tool(
+    name="read_docs",
+    description=(
+        "Read several documents in one call. Returns each document's contents wrapped in "
+        "a <document id=\"...\" version=\"...\"> tag; missing documents are reported in place."
+    )
+)
+async def read_documents(
+    doc_ids: list[str] = Field(description="Ids of the documents to read")
+):
+    print(f"Read documents tool called with {doc_ids}...")
+
+    def read_all() -> str:
+        parts = []
+        for doc_id in doc_ids:
+            if doc_id in docs:
+                # Content and version come from the same snapshot
+                snapshot = docs.snapshot(doc_id)
+                text = snapshot.table.read().decode(errors="replace")
+                parts.append(f'<document id="{doc_id}" version="{snapshot.version}">\n{text}\n</document>')
+            else:
+                parts.append(f'<document id="{doc_id}" error="Doc with id {doc_id} not found" />')
+        return "\n".join(parts)
+
+    return await anyio.to_thread.run_sync(read_all)
+
+
+class DocumentEdit(BaseModel):
+    doc_id: str = Field(description="Id of the document to edit")
+    old_str: str = Field(
+        description="The text to replace. Must match exactly, including whitespace.")
+    new_str: str = Field(
+        description="The new text to insert in place of the old text.")
+    first_match_only: bool = Field(
+        default=False,
+        description="Replace only the first match instead of every match.")
+    expected_version: str | None = Field(
+        default=None,
+        description="Version the document must be at before the batch, as reported by read_docs.")
+
+
+@mcp.tool(
+    name="edit_document_batch",
+    description=(
+        "Apply many edits, to one or several documents, in one call. Edits are applied "
+        "in order and atomically: if any edit matches nothing or names a missing "
+        "document, or a document is no longer at an edit's expected_version, none of them "
+        "is applied. Reports the replacements made by each edit."
+    )
+)
+async def edit_document_batch(
+    edits: list[DocumentEdit] = Field(description="The edits to apply, in order")
+):
+    print(f"Edit document batch tool called with {len(edits)} edits...")
+    expected_versions: dict[str, str] = {}
+    for edit in edits:
+        if edit.expected_version is None:
+            continue
+        if expected_versions.setdefault(edit.doc_id, edit.expected_version) != edit.expected_version:
+            raise ValueError(f"Edits expect different versions of document {edit.doc_id}")
+    counts = await anyio.to_thread.run_sync(
+        docs.replace_many,
+        [(edit.doc_id, edit.old_str, edit.new_str, edit.first_match_only) for edit in edits],
+        expected_versions,
+    )
+    edited = {edit.doc_id for edit in edits}
+    subscriptions.notify_updated(lambda uri: doc_id_from_uri(uri) in edited)
+    results = [
+        f"{number}. {edit.doc_id}: {count} replacement{'s' if count != 1 else ''}"
+        for number, (edit, count) in enumerate(zip(edits, counts), 1)
+    ]
+    versions = ", ".join(f"{doc_id} is at version {docs.version(doc_id)}" for doc_id in sorted(edited))
+    return f"Successfully applied {len(edits)} edits; {versions}\n" + "\n".join(results)
+
+
+@mcp.tool(
+    name="search_documents",
+    description=(
+        "Search all documents for the given words and return the best matching "
+        "documents, ranked by relevance, each with a snippet of matching text."
+    )
+)
+async def search_documents(
+    query: str = Field(description="Words to search for"),
+    limit: int = Field(default=5, description="Maximum number of documents to return")
+):
+    print(f"Search documents tool called with {query!r}...")
+
+    def search() -> list[str]:
+        return [
+            f"{doc_id} (score {score:.2f}): {index.snippet(doc_id, query)}"
+            for doc_id, score in index.search(query, limit)
+            if doc_id in docs
+        ]
+
+    # The first search builds the index, and snippets read the documents
+    results = await anyio.to_thread.run_sync(search)
+    if not results:
+        return f"No documents match {query!r}"
+    return "\n".join(results)
 
 
 @mcp.resource(
@@ -53,16 +230,233 @@ def edit_document(
 )
 def list_docs() -> list[str]:
     print(f"Listing resources called")
-    return list(docs.keys())
+    return docs.ids()
 
 
 @mcp.resource(
     "docs://{doc_id}",
     mime_type="text/plain"
 )
-def get_doc(doc_id: str) -> str:
+async def get_doc(doc_id: str) -> str:
     print(f"Getting document resource called with {doc_id}")
-    return docs[doc_id]
+    return await anyio.to_thread.run_sync(docs.read, doc_id)
+
+
+@mcp.resource(
+    "docs://{doc_id}/bytes/{offset}/{length}",
+    mime_type="text/plain"
+)
+async def get_doc_bytes(doc_id: str, offset: int, length: int) -> str:
+    # Reads of existing documents are answered by read_byte_range below
+    print(f"Getting bytes {offset}+{length} of document resource {doc_id}")
+    text, _ = await anyio.to_thread.run_sync(lambda: docs.read_range(docs.snapshot(doc_id), offset, length))
+    return text
+
+
+@mcp.resource(
+    "docs://{doc_id}/lines/{start_line}/{end_line}",
+    mime_type="text/plain"
+)
+async def get_doc_lines(doc_id: str, start_line: int, end_line: int) -> str:
+    print(f"Getting lines {start_line}-{end_line} of document resource {doc_id}")
+    return await anyio.to_thread.run_sync(docs.read_lines, doc_id, start_line, end_line)
+
+
+# `docs://{doc_id}/bytes/{offset}/{length}`
+BYTE_RANGE_URI = re.compile(r"docs://[^/?]+/bytes/(\d+)/(\d+)")
+
+
+def is_listing_uri(uri: str) -> bool:
+    return uri.split("?")[0] == LISTING_URI
+
+
+def doc_id_from_uri(uri: str) -> str | None:
+    """Return the document a docs:// resource URI refers to, if any."""
+    if not uri.startswith("docs://") or is_listing_uri(uri):
+        return None
+    return uri.removeprefix("docs://").split("/")[0]
+
+
+# Paginated listing: `docs://documents?prefix=re&cursor=report.pdf&limit=100`
+# returns `{"ids": [...], "nextCursor": ...}` with the ids in sorted order.
+# The cursor is the last id of the previous page, so pages stay consistent
+# while documents are added or removed. Plain `docs://documents` still
+# returns every id as a JSON list.
+def read_listing_page(uri: str) -> str:
+    query = parse_qs(urlsplit(uri).query)
+    prefix = query.get("prefix", [""])[0]
+    cursor = query.get("cursor", [None])[0]
+    try:
+        limit = int(query.get("limit", [LISTING_PAGE_SIZE])[0])
+    except ValueError:
+        raise ValueError("limit must be a number")
+    if not 1 <= limit <= MAX_LISTING_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {MAX_LISTING_PAGE_SIZE}")
+
+    print(f"Listing resources called with prefix {prefix!r} after {cursor!r}")
+    # One id more than asked for tells whether there is a next page
+    ids = docs.ids(prefix, after=cursor, limit=limit + 1)
+    next_cursor = ids[limit - 1] if len(ids) > limit else None
+    return json.dumps({"ids": ids[:limit], "nextCursor": next_cursor})
+
+
+# Conditional reads: every document resource carries the document's version
+# in `_meta.version`, and the listing resources carry a version of the
+# document list. A client that sends the version it already holds as
+# `_meta.ifNoneMatch` gets an empty reply marked `notModified` instead of the
+# content. FastMCP has no hook for this, so its handler is wrapped.
+read_resource_handler = mcp._mcp_server.request_handlers[types.ReadResourceRequest]
+
+
+async def read_resource_conditionally(request: types.ReadResourceRequest) -> types.ServerResult:
+    # Sessions that read documents hear about changes to the document list
+    subscriptions.track()
+    uri = str(request.params.uri)
+    doc_id = doc_id_from_uri(uri)
+    if is_listing_uri(uri):
+        version = docs.listing_version()
+    elif doc_id is not None and doc_id in docs:
+        # Taken before reading, so a concurrent edit can only make the version
+        # older than the content, which costs the client one extra read later
+        version = docs.version(doc_id)
+    else:
+        return await read_resource_handler(request)
+
+    request_meta = request.params.meta
+    if request_meta is not None and getattr(request_meta, "ifNoneMatch", None) == version:
+        print(f"Document resource {request.params.uri} not modified")
+        return types.ServerResult(
+            types.ReadResourceResult(
+                contents=[
+                    types.TextResourceContents(
+                        uri=request.params.uri,
+                        text="",
+                        mimeType="application/json" if doc_id is None else "text/plain",
+                        _meta={"version": version, "notModified": True},
+                    )
+                ]
+            )
+        )
+
+    if uri != LISTING_URI and is_listing_uri(uri):
+        return types.ServerResult(
+            types.ReadResourceResult(
+                contents=[
+                    types.TextResourceContents(
+                        uri=request.params.uri,
+                        text=read_listing_page(uri),
+                        mimeType="application/json",
+                        _meta={"version": version},
+                    )
+                ]
+            )
+        )
+
+    byte_range = BYTE_RANGE_URI.fullmatch(uri)
+    if byte_range:
+        return await read_byte_range(request, doc_id, int(byte_range[1]), int(byte_range[2]))
+
+    result = await read_resource_handler(request)
+    for contents in result.root.contents:
+        contents.meta = {"version": version}
+    return result
+
+
+mcp._mcp_server.request_handlers[types.ReadResourceRequest] = read_resource_conditionally
+
+
+# Byte ranges: a read of `docs://{doc_id}/bytes/{offset}/{length}` ends on a
+# whole character, so it may return a little less than `length` bytes. Its
+# `_meta` says which version the text comes from, the offset where the text
+# ends and the size of the document, so a client can read a large document
+# as consecutive ranges and tell whether it changed between them.
+async def read_byte_range(
+    request: types.ReadResourceRequest, doc_id: str, offset: int, length: int
+) -> types.ServerResult:
+    print(f"Getting bytes {offset}+{length} of document resource {doc_id}")
+
+    def read() -> tuple[Snapshot, str, int]:
+        snapshot = docs.snapshot(doc_id)
+        return snapshot, *docs.read_range(snapshot, offset, length)
+
+    snapshot, text, end = await anyio.to_thread.run_sync(read)
+    return types.ServerResult(
+        types.ReadResourceResult(
+            contents=[
+                types.TextResourceContents(
+                    uri=request.params.uri,
+                    text=text,
+                    mimeType="text/plain",
+                    _meta={"version": snapshot.version, "end": end, "size": len(snapshot.table)},
+                )
+            ]
+        )
+    )
+
+
+# `resources/list` enumerates the documents page by page after the static
+# resources; as in the listing resource, the cursor is the last id sent.
+list_resources_handler = mcp._mcp_server.request_handlers[types.ListResourcesRequest]
+
+
+async def list_resources_paginated(request: types.ListResourcesRequest) -> types.ServerResult:
+    cursor = request.params.cursor if request.params else None
+    resources = []
+    if cursor is None:
+        resources += (await list_resources_handler(request)).root.resources
+    ids = docs.ids(after=cursor, limit=MAX_LISTING_PAGE_SIZE + 1)
+    resources += [
+        types.Resource(uri=f"docs://{doc_id}", name=doc_id, mimeType="text/plain")
+        for doc_id in ids[:MAX_LISTING_PAGE_SIZE]
+    ]
+    next_cursor = ids[MAX_LISTING_PAGE_SIZE - 1] if len(ids) > MAX_LISTING_PAGE_SIZE else None
+    return types.ServerResult(types.ListResourcesResult(resources=resources, nextCursor=next_cursor))
+
+
+mcp._mcp_server.request_handlers[types.ListResourcesRequest] = list_resources_paginated
+
+
+# Documents up to this many bytes are embedded in the prompts that work on them
+PROMPT_CONTENT_BUDGET = 32 * 1024
+
+
+def embedded_document(doc_id: str, max_bytes: int) -> tuple[types.EmbeddedResource, str]:
+    """Return a document as an embedded resource and a note on what it holds.
+
+    A document over `max_bytes` is cut to its first lines that fit, and the
+    note tells the model how to read the rest.
+    """
+    if doc_id not in docs:
+        raise ValueError(f"Doc with id {doc_id} not found")
+    snapshot = docs.snapshot(doc_id)
+    size = len(snapshot.table)
+    data = snapshot.table.read(0, max_bytes)
+    if size <= max_bytes:
+        uri = f"docs://{doc_id}"
+        note = (
+            f"The full document (version {snapshot.version}) is included above, "
+            "so you don't need to read it with a tool."
+        )
+    else:
+        # Do not hand the model half a line
+        cut = data.rfind(b"\n") + 1 or len(data)
+        data = data[:cut]
+        uri = f"docs://{doc_id}/bytes/0/{cut}"
+        note = (
+            f"Only the first {cut} of the document's {size} bytes (version {snapshot.version}) "
+            "are included above. Use the 'read_doc_contents' tool with an offset or a line "
+            "range to read the rest."
+        )
+    resource = types.EmbeddedResource(
+        type="resource",
+        resource=types.TextResourceContents(
+            uri=uri,
+            mimeType="text/plain",
+            text=data.decode(errors="replace"),
+            _meta={"version": snapshot.version},
+        ),
+    )
+    return resource, note
 
 
 @mcp.prompt(
@@ -70,10 +464,22 @@ def get_doc(doc_id: str) -> str:
     description="Rewrites the contents of the document in Markdown format."
 )
 def format_document(
-    doc_id: str = Field(description="Id of the document to format")
+    doc_id: str = Field(description="Id of the document to format"),
+    include_content: bool = Field(
+        default=True,
+        description="Embed the document in the prompt, so the model needn't read it first"),
+    max_bytes: int = Field(
+        default=PROMPT_CONTENT_BUDGET,
+        description="Largest part of the document to embed, in bytes")
 ) -> list[base.Message]:
     
     print(f"Formatting document prompt called with {doc_id}...")
+
+    messages: list[base.Message] = []
+    note = ""
+    if include_content:
+        resource, note = embedded_document(doc_id, max_bytes)
+        messages.append(base.UserMessage(resource))
     
     prompt = f"""
     Your goal is to reformat a document to be written with markdown syntax.
@@ -82,11 +488,13 @@ def format_document(
     <document_id>
     {doc_id}
     </document_id>
+    {note}
 
     Add in headers, bullet points, tables, etc as necessary. Feel free to add in extra text, but don't change the meaning of the report.
-    Use the 'edit_document' tool to edit the document. After the document has been edited, respond with the final version of the doc. Don't explain your changes.
+    Use the 'edit_document_batch' tool to make all of your edits in a single call. After the document has been edited, respond with the final version of the doc. Don't explain your changes.
     """
-    return [base.UserMessage(prompt)]
+    messages.append(base.UserMessage(prompt))
+    return messages
 
 
 
@@ -95,11 +503,22 @@ def format_document(
     description="summarizes the contents of the document."
 )
 def summarize_document(
-    doc_id: str = Field(description="Id of the document to summarize")
-) -> list :
-    from mcp.types import PromptMessage, TextContent
+    doc_id: str = Field(description="Id of the document to summarize"),
+    include_content: bool = Field(
+        default=True,
+        description="Embed the document in the prompt, so the model needn't read it first"),
+    max_bytes: int = Field(
+        default=PROMPT_CONTENT_BUDGET,
+        description="Largest part of the document to embed, in bytes")
+) -> list[base.Message]:
     print(f"Summarizing document prompt called with {doc_id}...")
 
+    messages: list[base.Message] = []
+    note = ""
+    if include_content:
+        resource, note = embedded_document(doc_id, max_bytes)
+        messages.append(base.UserMessage(resource))
+
     prompt = f"""
     Your goal is to summarize a document.
 
@@ -107,13 +526,65 @@ def summarize_document(
     <document_id>
     {doc_id}
     </document_id>
+    {note}
 
     Provide a concise summary of the document's contents, highlighting the key points and findings.
     """
-    return [PromptMessage(role="user", content=TextContent(type="text", text=prompt))]
+    messages.append(base.UserMessage(prompt))
+    return messages
+
+
+async def watch_documents(interval: float = 1.0) -> None:
+    """Notify clients when documents are added to or removed from the store."""
+    known_ids = set(docs.ids())
+    directory_mtime = docs.directory.stat().st_mtime_ns
+    while True:
+        await asyncio.sleep(interval)
+        # Only list the directory again once an entry in it has changed
+        mtime = docs.directory.stat().st_mtime_ns
+        if mtime == directory_mtime:
+            continue
+        directory_mtime = mtime
+        ids = set(docs.ids())
+        if ids != known_ids:
+            changed = ids ^ known_ids
+            removed = known_ids - ids
+            known_ids = ids
+            print("Document list changed")
+
+            def forget_and_index() -> None:
+                for doc_id in removed:
+                    docs.forget(doc_id)
+                index.sync(ids)
+
+            # Indexing reads every added document, so it stays off the loop
+            await anyio.to_thread.run_sync(forget_and_index)
+            # Subscribers of an added or removed document hear about it too
+            subscriptions.notify_updated(
+                lambda uri: is_listing_uri(uri) or doc_id_from_uri(uri) in changed
+            )
+            subscriptions.notify_list_changed()
 
 
 mcp_app = mcp.streamable_http_app()
+session_manager_lifespan = mcp_app.router.lifespan_context
+
+
+@asynccontextmanager
+async def lifespan(app):
+    open_documents()
+    try:
+        async with session_manager_lifespan(app):
+            watcher = asyncio.create_task(watch_documents())
+            try:
+                yield
+            finally:
+                watcher.cancel()
+    finally:
+        docs.close()
+
+
+mcp_app.router.lifespan_context = lifespan
 
 
 if __name__ == "__main__":
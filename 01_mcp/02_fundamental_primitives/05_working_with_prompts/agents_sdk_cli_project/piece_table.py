@@ -0,0 +1,188 @@
+"""
+Piece table used by the DocumentMCP store to edit documents in place.
+
+A document is the concatenation of pieces, each a slice of either the
+original (memory-mapped) file or an append-only buffer of inserted text.
+An edit splits the pieces around each match and adds one piece for the new
+text, so it never copies the document: its cost is the search for the old
+text plus work proportional to the number of pieces.
+"""
+
+import mmap
+import re
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
+from typing import Iterator, NamedTuple
+
+ORIGINAL = 0
+ADDED = 1
+# Large pieces are handed out in chunks of at most this many bytes
+CHUNK_SIZE = 1 << 20
+NEWLINE = re.compile(rb"\n")
+
+
+class Piece(NamedTuple):
+    buffer: int
+    start: int
+    length: int
+
+
+class PieceTable:
+    """
+    The bytes of one document as a list of pieces.
+
+    `_ends[i]` is the document offset at which piece `i` ends, so the piece
+    holding any offset is found by bisection.
+    """
+
+    def __init__(self, original: bytes | mmap.mmap = b""):
+        self._buffers = (original, bytearray())
+        self.pieces: list[Piece] = [Piece(ORIGINAL, 0, len(original))] if len(original) else []
+        self._ends: list[int] = [piece.length for piece in self.pieces]
+        # offsets at which each line starts, built on first use after an edit
+        self._line_starts: array | None = None
+
+    def __len__(self) -> int:
+        return self._ends[-1] if self._ends else 0
+
+    def _piece_bytes(self, piece: Piece, start: int = 0, end: int | None = None) -> bytes:
+        end = piece.length if end is None else end
+        return self._buffers[piece.buffer][piece.start + start : piece.start + end]
+
+    def chunks(self, offset: int = 0, length: int | None = None) -> Iterator[bytes]:
+        """Yield the bytes from `offset` on (`length` of them at most) in chunks."""
+        end = len(self) if length is None else min(len(self), offset + length)
+        index = bisect_right(self._ends, offset)
+        while offset < end and index < len(self.pieces):
+            piece = self.pieces[index]
+            piece_start = self._ends[index] - piece.length
+            stop = min(end, self._ends[index])
+            while offset < stop:
+                chunk_end = min(stop, offset + CHUNK_SIZE)
+                yield self._piece_bytes(piece, offset - piece_start, chunk_end - piece_start)
+                offset = chunk_end
+            index += 1
+
+    def read(self, offset: int = 0, length: int | None = None) -> bytes:
+        return b"".join(self.chunks(offset, length))
+
+    def line_starts(self) -> array:
+        """Return the offset at which each line starts; line 1 starts at 0."""
+        if self._line_starts is None:
+            line_starts = array("Q", [0])
+            offset = 0
+            for chunk in self.chunks():
+                line_starts.extend(offset + match.end() for match in NEWLINE.finditer(chunk))
+                offset += len(chunk)
+            self._line_starts = line_starts
+        return self._line_starts
+
+    def find(self, needle: bytes, first_only: bool = False) -> list[int]:
+        """Return the offsets of the non-overlapping occurrences of `needle`, left to right."""
+        if not needle:
+            raise ValueError("Cannot search for empty text")
+        matches: list[int] = []
+        size = len(needle)
+        # Matches may span pieces: `carry` holds the last size - 1 bytes before the current piece
+        carry = b""
+        next_allowed = 0
+        for piece, piece_end in zip(self.pieces, self._ends):
+            buffer = self._buffers[piece.buffer]
+            piece_start = piece_end - piece.length
+
+            if carry:
+                window = carry + self._piece_bytes(piece, 0, min(size - 1, piece.length))
+                position = window.find(needle)
+                while position != -1 and position < len(carry):
+                    match = piece_start - len(carry) + position
+                    if position + size > len(carry) and match >= next_allowed:
+                        matches.append(match)
+                        next_allowed = match + size
+                        if first_only:
+                            return matches
+                    position = window.find(needle, position + 1)
+
+            position = piece.start + max(0, next_allowed - piece_start)
+            stop = piece.start + piece.length
+            while (position := buffer.find(needle, position, stop)) != -1:
+                match = piece_start + position - piece.start
+                matches.append(match)
+                next_allowed = match + size
+                if first_only:
+                    return matches
+                position += size
+
+            if size > 1:
+                tail = self._piece_bytes(piece, max(0, piece.length - size + 1))
+                carry = (carry + tail)[-(size - 1) :]
+        return matches
+
+    def _slice(self, start: int, end: int) -> list[Piece]:
+        """Return the pieces covering the document bytes from `start` to `end`."""
+        if start >= end:
+            return []
+        first = bisect_right(self._ends, start)
+        last = bisect_right(self._ends, end - 1)
+        pieces = self.pieces[first : last + 1]
+        # Trim the last piece first: with a single piece both ends are cut
+        end_piece = pieces[-1]
+        pieces[-1] = end_piece._replace(length=end_piece.length - (self._ends[last] - end))
+        cut = start - (self._ends[first] - self.pieces[first].length)
+        pieces[0] = pieces[0]._replace(start=pieces[0].start + cut, length=pieces[0].length - cut)
+        return pieces
+
+    def replace(self, old: bytes, new: bytes, first_only: bool = False) -> int:
+        """Replace occurrences of `old` with `new`; returns the number replaced."""
+        matches = self.find(old, first_only)
+        self.replace_matches(matches, len(old), new)
+        return len(matches)
+
+    def replace_matches(self, matches: list[int], old_length: int, new: bytes) -> None:
+        """Replace the `old_length` bytes at each offset in `matches`, as found by `find`."""
+        if not matches:
+            return
+
+        added = self._buffers[ADDED]
+        inserted = Piece(ADDED, len(added), len(new))
+        added += new
+
+        pieces: list[Piece] = []
+        kept_from = 0
+        for match in matches:
+            pieces += self._slice(kept_from, match)
+            if new:
+                pieces.append(inserted)
+            kept_from = match + old_length
+        pieces += self._slice(kept_from, len(self))
+
+        self.pieces = pieces
+        self._ends = list(accumulate(piece.length for piece in pieces))
+        self._line_starts = None
+
+    def snapshot(self) -> "PieceTable":
+        """Return a read-only copy of the current content that later edits leave alone."""
+        # Edits build new piece lists and only append to the added buffer, so
+        # the copy can share both with this table
+        view = PieceTable.__new__(PieceTable)
+        view._buffers = self._buffers
+        view.pieces = self.pieces
+        view._ends = self._ends
+        view._line_starts = self._line_starts
+        return view
+
+    def state(self) -> tuple[list[Piece], list[int], int]:
+        """Return the current content, to be put back by `restore`."""
+        return self.pieces, self._ends, len(self._buffers[ADDED])
+
+    def restore(self, state: tuple[list[Piece], list[int], int]) -> None:
+        """Undo every edit made since `state` was taken."""
+        # Edits build new piece lists, so the saved ones are unchanged
+        self.pieces, self._ends, added_length = state
+        del self._buffers[ADDED][added_length:]
+        self._line_starts = None
+
+    def close(self) -> None:
+        original = self._buffers[ORIGINAL]
+        if isinstance(original, mmap.mmap):
+            original.close()
@@ -0,0 +1,154 @@
+"""
+Inverted index with BM25 ranking over the DocumentMCP store.
+
+The index is built on the first search and then kept up to date: edits
+re-tokenize only the text around each replacement, and documents added to
+or removed from the store are indexed or dropped one by one.
+"""
+
+import math
+import re
+import threading
+from collections import Counter
+
+from document_store import DocumentStore
+
+TOKEN = re.compile(r"\w+")
+SNIPPET_RADIUS = 120
+# Documents are scanned for snippets in windows of this many bytes
+SCAN_WINDOW = 1 << 20
+
+
+def tokenize(text: str) -> list[str]:
+    return TOKEN.findall(text.lower())
+
+
+class SearchIndex:
+    """
+    Term postings for every document, ranked with Okapi BM25.
+    """
+
+    def __init__(self, store: DocumentStore, k1: float = 1.2, b: float = 0.75):
+        self.store = store
+        self.k1 = k1
+        self.b = b
+        self.built = False
+        # Edits of different documents may update the index from several threads
+        self._lock = threading.RLock()
+        # Held while the index is built, so concurrent first searches build it once
+        self._build_lock = threading.Lock()
+        # term -> doc id -> number of occurrences
+        self.postings: dict[str, dict[str, int]] = {}
+        # doc id -> number of tokens
+        self.doc_lengths: dict[str, int] = {}
+        self.total_length = 0
+
+    def build(self) -> None:
+        with self._build_lock:
+            if self.built:
+                return
+            for doc_id in self.store.ids():
+                self.add(doc_id)
+            self.built = True
+
+    def _update(self, doc_id: str, counts: Counter, sign: int) -> None:
+        for term, count in counts.items():
+            doc_counts = self.postings.setdefault(term, {})
+            remaining = doc_counts.get(doc_id, 0) + sign * count
+            if remaining > 0:
+                doc_counts[doc_id] = remaining
+            else:
+                doc_counts.pop(doc_id, None)
+                if not doc_counts:
+                    del self.postings[term]
+        length = sign * sum(counts.values())
+        self.doc_lengths[doc_id] = self.doc_lengths.get(doc_id, 0) + length
+        self.total_length += length
+
+    def add(self, doc_id: str) -> None:
+        # No edit can land between reading the document and indexing it. The
+        # document lock is always taken before the index lock, as edits do.
+        with self.store.write_lock(doc_id), self._lock:
+            counts = Counter(tokenize(self.store.read(doc_id)))
+            self.remove(doc_id)
+            self._update(doc_id, counts, +1)
+
+    def remove(self, doc_id: str) -> None:
+        with self._lock:
+            if doc_id not in self.doc_lengths:
+                return
+            counts = Counter(
+                {term: doc_counts[doc_id] for term, doc_counts in self.postings.items() if doc_id in doc_counts}
+            )
+            self._update(doc_id, counts, -1)
+            del self.doc_lengths[doc_id]
+
+    def sync(self, ids: set[str]) -> None:
+        """Index documents new to the store and drop the ones no longer in it."""
+        # Waits for a build in progress, which may have listed the store before the change
+        with self._build_lock:
+            if not self.built:
+                return
+            for doc_id in self.doc_lengths.keys() - ids:
+                self.remove(doc_id)
+            for doc_id in ids - self.doc_lengths.keys():
+                self.add(doc_id)
+
+    def apply_edit(self, doc_id: str, removed: list[bytes], added: list[bytes]) -> None:
+        """Update the postings of a document from the text regions an edit replaced."""
+        before = Counter(token for region in removed for token in tokenize(region.decode(errors="replace")))
+        after = Counter(token for region in added for token in tokenize(region.decode(errors="replace")))
+        after.subtract(before)
+        with self._lock:
+            # Documents not indexed yet are read with the edit once they are
+            if doc_id not in self.doc_lengths:
+                return
+            self._update(doc_id, Counter({term: count for term, count in after.items() if count > 0}), +1)
+            self._update(doc_id, Counter({term: -count for term, count in after.items() if count < 0}), -1)
+
+    def search(self, query: str, limit: int = 5) -> list[tuple[str, float]]:
+        """Return up to `limit` (doc id, score) pairs, best match first."""
+        if not self.built:
+            self.build()
+        with self._lock:
+            return self._rank(query, limit)
+
+    def _rank(self, query: str, limit: int) -> list[tuple[str, float]]:
+        if not self.doc_lengths:
+            return []
+        documents = len(self.doc_lengths)
+        average_length = self.total_length / documents or 1
+        scores: Counter = Counter()
+        for term in set(tokenize(query)):
+            doc_counts = self.postings.get(term)
+            if not doc_counts:
+                continue
+            idf = math.log(1 + (documents - len(doc_counts) + 0.5) / (len(doc_counts) + 0.5))
+            for doc_id, count in doc_counts.items():
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / average_length)
+                scores[doc_id] += idf * count * (self.k1 + 1) / (count + norm)
+        return scores.most_common(limit)
+
+    def snippet(self, doc_id: str, query: str) -> str:
+        """Return the text around the first occurrence of a query term."""
+        terms = tokenize(query)
+        pattern = re.compile(
+            r"\b(" + "|".join(re.escape(term) for term in terms) + r")\b", re.IGNORECASE
+        )
+        size = self.store.size(doc_id)
+        offset = 0
+        match_at = 0
+        while terms and offset < size:
+            window = self.store.read(doc_id, offset, SCAN_WINDOW)
+            match = pattern.search(window)
+            if match:
+                match_at = offset + len(window[: match.start()].encode())
+                break
+            # Overlap windows so a term cut at a window edge is still found
+            offset += max(SCAN_WINDOW - 256, 1)
+
+        start = max(0, match_at - SNIPPET_RADIUS)
+        text = " ".join(self.store.read(doc_id, start, 2 * SNIPPET_RADIUS).split())
+        prefix = "…" if start > 0 else ""
+        suffix = "…" if start + 2 * SNIPPET_RADIUS < size else ""
+        return f"{prefix}{text}{suffix}"
@@ -0,0 +1,222 @@
+"""
+Concurrency stress benchmark for the DocumentMCP server.
+
+First, 16 threads increment counters in shared documents by calling
+`DocumentStore.replace` and `replace_many` directly, each with the version
+it read, while small thresholds keep the store writing documents back and
+compacting its journal. The counters must match the successful edits, in
+the store and after reopening it.
+
+Then it starts the server on a scratch documents directory and runs 64 client
+sessions at once. Each session reads documents with `read_docs` and
+increments a counter in a shared document with `edit_document`, passing
+the version it read as `expected_version` and retrying when another
+session got there first. At the end the counters must add up to the
+number of successful edits, or some edit was lost.
+
+Run with: uv run python stress_benchmark.py
+"""
+
+import asyncio
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from document_store import DocumentStore
+from mcp_client import MCPClient
+
+THREADS = 16
+EDITS_PER_THREAD = 200
+SESSIONS = 64
+DOCS = 8
+READS_PER_SESSION = 50
+EDITS_PER_SESSION = 10
+PORT = 8765
+SERVER_URL = f"http://127.0.0.1:{PORT}/mcp/"
+
+DOCUMENT = re.compile(r'<document id="([^"]+)" version="([^"]+)">\n(.*?)\n</document>', re.S)
+COUNT = re.compile(r"count=(\d+);")
+
+
+def make_documents(directory: Path) -> None:
+    filler = "lorem ipsum dolor sit amet " * 400
+    for number in range(DOCS):
+        (directory / f"doc{number}.txt").write_text(f"count=0;\n{filler}\n")
+
+
+def read_count(store: DocumentStore, doc_id: str) -> tuple[str, int]:
+    snapshot = store.snapshot(doc_id)
+    return snapshot.version, int(COUNT.match(snapshot.table.read(0, 64).decode()).group(1))
+
+
+def increment(store: DocumentStore, number: int, edit: int) -> tuple[int, int]:
+    """Add one to a counter, or to two at once in a batch; returns the counters and conflicts."""
+    doc_ids = sorted({f"doc{(number + edit) % DOCS}.txt", f"doc{(number * 3 + edit) % DOCS}.txt"})
+    if edit % 2 == 0:
+        doc_ids = doc_ids[:1]
+    conflicts = 0
+    while True:
+        versions, edits = {}, []
+        for doc_id in doc_ids:
+            versions[doc_id], count = read_count(store, doc_id)
+            edits.append((doc_id, f"count={count};", f"count={count + 1};", True))
+        try:
+            if len(edits) == 1:
+                store.replace(*edits[0], expected_version=versions[doc_ids[0]])
+            else:
+                store.replace_many(edits, versions)
+            return len(edits), conflicts
+        except ValueError:
+            conflicts += 1
+
+
+def stress_store(directory: Path) -> tuple[int, int, float]:
+    """Run the threaded phase; returns increments made, conflicts retried and seconds taken."""
+    make_documents(directory)
+    store = DocumentStore(directory, max_pieces=8, sync=False, max_journal_bytes=64 * 1024)
+    increments, conflicts = [0] * THREADS, [0] * THREADS
+    barrier = threading.Barrier(THREADS)
+
+    def work(number: int) -> None:
+        barrier.wait()
+        for edit in range(EDITS_PER_THREAD):
+            counters, retried = increment(store, number, edit)
+            increments[number] += counters
+            conflicts[number] += retried
+
+    # Switch threads often so edits interleave as much as possible
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    start = time.perf_counter()
+    try:
+        threads = [threading.Thread(target=work, args=(number,)) for number in range(THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(switch_interval)
+    elapsed = time.perf_counter() - start
+
+    for reopen in (False, True):
+        if reopen:
+            store.close()
+            store = DocumentStore(directory)
+        counted = sum(read_count(store, f"doc{number}.txt")[1] for number in range(DOCS))
+        if counted != sum(increments):
+            print(f"lost edits in the store{' after reopening' if reopen else ''}: {sum(increments) - counted}")
+            sys.exit(1)
+    store.close()
+    return sum(increments), sum(conflicts), elapsed
+
+
+async def read_doc(client: MCPClient, doc_id: str) -> tuple[str, str]:
+    result = await client.call_tool("read_docs", {"doc_ids": [doc_id]})
+    _, version, text = DOCUMENT.match(result.content[0].text).groups()
+    return version, text
+
+
+async def run_session(number: int, stats: dict[str, list[float] | int]) -> None:
+    async with MCPClient(SERVER_URL, chunk_size=None) as client:
+        for read in range(READS_PER_SESSION):
+            start = time.perf_counter()
+            await read_doc(client, f"doc{(number + read) % DOCS}.txt")
+            stats["read_latencies"].append(time.perf_counter() - start)
+
+        for edit in range(EDITS_PER_SESSION):
+            # Sessions share the documents, so edits of the same one collide
+            doc_id = f"doc{(number + edit) % DOCS}.txt"
+            start = time.perf_counter()
+            while True:
+                version, text = await read_doc(client, doc_id)
+                count = int(COUNT.search(text).group(1))
+                result = await client.call_tool(
+                    "edit_document",
+                    {
+                        "doc_id": doc_id,
+                        "old_str": f"count={count};",
+                        "new_str": f"count={count + 1};",
+                        "first_match_only": True,
+                        "expected_version": version,
+                    },
+                )
+                if not result.isError:
+                    break
+                # Only a version conflict is worth retrying; anything else is a bug
+                message = result.content[0].text
+                if "changed: it is at version" not in message:
+                    raise RuntimeError(f"Edit of {doc_id} failed: {message}")
+                stats["conflicts"] += 1
+            stats["edit_latencies"].append(time.perf_counter() - start)
+
+
+async def wait_for_server(timeout: float = 20.0) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", PORT)).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.2)
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    return sorted(values)[int(fraction * (len(values) - 1))]
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as directory:
+        increments, conflicts, elapsed = stress_store(Path(directory))
+    print(f"{THREADS} threads, {increments} increments in {elapsed:.1f} s, {conflicts} version conflicts retried")
+    print("lost edits: 0")
+    print()
+
+    with tempfile.TemporaryDirectory() as directory:
+        make_documents(Path(directory))
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "mcp_server:mcp_app", "--port", str(PORT), "--log-level", "error"],
+            env={**os.environ, "DOCUMENTS_DIR": directory},
+            cwd=Path(__file__).parent,
+            stdout=subprocess.DEVNULL,
+        )
+        try:
+            await wait_for_server()
+            stats = {"read_latencies": [], "edit_latencies": [], "conflicts": 0}
+            start = time.perf_counter()
+            await asyncio.gather(*(run_session(number, stats) for number in range(SESSIONS)))
+            elapsed = time.perf_counter() - start
+
+            async with MCPClient(SERVER_URL, chunk_size=None) as client:
+                counts = [
+                    int(COUNT.search((await read_doc(client, f"doc{number}.txt"))[1]).group(1))
+                    for number in range(DOCS)
+                ]
+        finally:
+            server.terminate()
+            server.wait()
+
+    reads, edits = stats["read_latencies"], stats["edit_latencies"]
+    print(f"{SESSIONS} sessions, {len(reads)} reads and {len(edits)} edits in {elapsed:.1f} s")
+    print(f"{'':>6} {'ops/s':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for name, latencies in (("read", reads), ("edit", edits)):
+        print(
+            f"{name:>6} {len(latencies) / elapsed:>8.0f} "
+            f"{percentile(latencies, 0.5) * 1e3:>8.1f} {percentile(latencies, 0.99) * 1e3:>8.1f}"
+        )
+    print(f"version conflicts retried: {stats['conflicts']}")
+    lost = len(edits) - sum(counts)
+    print(f"lost edits: {lost}")
+    if lost:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
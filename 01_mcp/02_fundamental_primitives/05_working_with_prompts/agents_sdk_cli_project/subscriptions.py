@@ -0,0 +1,83 @@
+"""
+Resource subscriptions for the DocumentMCP server.
+
+FastMCP does not implement `resources/subscribe`, so `ResourceSubscriptions`
+registers the low-level handlers itself, advertises the capability, and
+remembers which session subscribed to which URI. The server then calls
+`notify_updated` and `notify_list_changed` when documents change; they send
+from background tasks, so an edit never waits for a slow subscriber.
+"""
+
+import asyncio
+from functools import partial
+from typing import Awaitable, Callable
+from weakref import WeakKeyDictionary
+
+from mcp import types
+from mcp.server.lowlevel import Server
+from mcp.server.session import ServerSession
+from pydantic import AnyUrl
+
+
+class ResourceSubscriptions:
+    def __init__(self, server: Server, send_timeout: float = 5.0):
+        self.server = server
+        # Seconds a session gets to take its notifications before it is dropped
+        self.send_timeout = send_timeout
+        # session -> URIs it subscribed to; a session is forgotten once it is gone
+        self.sessions: WeakKeyDictionary[ServerSession, set[str]] = WeakKeyDictionary()
+        # Keep references so that sends in flight are not garbage collected
+        self._sends: set[asyncio.Task] = set()
+
+        @server.subscribe_resource()
+        async def subscribe(uri: AnyUrl) -> None:
+            self.track().add(str(uri))
+
+        @server.unsubscribe_resource()
+        async def unsubscribe(uri: AnyUrl) -> None:
+            self.track().discard(str(uri))
+
+        # The SDK always advertises subscribe=False and listChanged=False
+        create_initialization_options = server.create_initialization_options
+
+        def create_initialization_options_with_subscriptions(*args, **kwargs):
+            options = create_initialization_options(*args, **kwargs)
+            options.capabilities.resources = types.ResourcesCapability(
+                subscribe=True, listChanged=True
+            )
+            return options
+
+        server.create_initialization_options = create_initialization_options_with_subscriptions
+
+    def track(self) -> set[str]:
+        """Remember the session of the current request; returns its subscriptions."""
+        return self.sessions.setdefault(self.server.request_context.session, set())
+
+    def notify_updated(self, matches: Callable[[str], bool]) -> None:
+        """Send `notifications/resources/updated` for every subscribed URI that matches."""
+        for session, uris in list(self.sessions.items()):
+            matched = [uri for uri in uris if matches(uri)]
+            if matched:
+                self._send(session, [partial(session.send_resource_updated, AnyUrl(uri)) for uri in matched])
+
+    def notify_list_changed(self) -> None:
+        """Send `notifications/resources/list_changed` to every known session."""
+        for session in list(self.sessions):
+            self._send(session, [session.send_resource_list_changed])
+
+    def _send(self, session: ServerSession, sends: list[Callable[[], Awaitable[None]]]) -> None:
+        # One task per session, so a stalled session holds up nobody else
+        task = asyncio.create_task(self._deliver(session, sends))
+        self._sends.add(task)
+        task.add_done_callback(self._sends.discard)
+
+    async def _deliver(self, session: ServerSession, sends: list[Callable[[], Awaitable[None]]]) -> None:
+        async def send_all() -> None:
+            for send in sends:
+                await send()
+
+        try:
+            await asyncio.wait_for(send_all(), self.send_timeout)
+        except Exception as e:
+            print(f"Dropping subscriptions of a session that could not be notified: {e!r}")
+            self.sessions.pop(session, None)
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The server's modules are top-level modules of the project, not an installed package
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,72 @@
+import pytest
+
+from document_store import DocumentStore
+
+
+class JournalFailure(OSError):
+    pass
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = DocumentStore(tmp_path)
+    store.seed({"a.txt": "alpha beta", "b.txt": "gamma delta"})
+    yield store
+    monkeypatch.undo()
+    store.close()
+
+
+def fail_journal(store, monkeypatch):
+    def log(edits):
+        raise JournalFailure("disk full")
+
+    monkeypatch.setattr(store, "_log", log)
+
+
+def test_edit_the_journal_refuses_leaves_the_document_unchanged(store, monkeypatch):
+    version = store.version("a.txt")
+    fail_journal(store, monkeypatch)
+
+    with pytest.raises(JournalFailure):
+        store.replace("a.txt", "beta", "BETA")
+    assert store.read("a.txt") == "alpha beta"
+    assert store.version("a.txt") == version
+    assert "a.txt" not in store._dirty
+
+    # The document takes edits again once the journal does, from where it was
+    monkeypatch.undo()
+    assert store.replace("a.txt", "alpha", "ALPHA", expected_version=version) == 1
+    assert store.read("a.txt") == "ALPHA beta"
+
+
+def test_batch_the_journal_refuses_leaves_every_document_unchanged(store, monkeypatch):
+    versions = {doc_id: store.version(doc_id) for doc_id in ("a.txt", "b.txt")}
+    fail_journal(store, monkeypatch)
+
+    with pytest.raises(JournalFailure):
+        store.replace_many([("a.txt", "beta", "BETA", False), ("b.txt", "gamma", "GAMMA", False)])
+    assert [store.read(doc_id) for doc_id in ("a.txt", "b.txt")] == ["alpha beta", "gamma delta"]
+    assert {doc_id: store.version(doc_id) for doc_id in versions} == versions
+
+    # Nor does the next edit publish the batch along with its own change
+    monkeypatch.undo()
+    store.replace("a.txt", "alpha", "ALPHA")
+    assert store.read("a.txt") == "ALPHA beta"
+    assert "b.txt" not in store._dirty
+
+
+def test_reopened_store_holds_only_journaled_edits(tmp_path, monkeypatch):
+    store = DocumentStore(tmp_path)
+    store.seed({"a.txt": "alpha beta"})
+    store.replace("a.txt", "alpha", "ALPHA")
+    fail_journal(store, monkeypatch)
+    with pytest.raises(JournalFailure):
+        store.replace("a.txt", "beta", "BETA")
+    monkeypatch.undo()
+    store.close()
+
+    reopened = DocumentStore(tmp_path)
+    try:
+        assert reopened.read("a.txt") == "ALPHA beta"
+    finally:
+        reopened.close()
@@ -58,4 +58,21 @@ if data and 'result' in data:
             if 'content' in message and 'text' in message['content']:
                 print(f"    Content: {message['content']['text']}")
 else:
-    print("No prompt data found or invalid response format")
\ No newline at end of file
+    print("No prompt data found or invalid response format")
+print("\n")
+print("="*60)
+
+print("Reading prompt with a resource URI...")
+
+# The server reads docs://plan.md itself, so the request stays small however large the document is
+response_uri = requests.post(url, headers=headers, json=get_body("prompts/get", {"name": "format", "arguments": {"doc_uri": "docs://plan.md"}}, id=3))
+
+data = parse_sse_response(response_uri.text)
+if data and 'result' in data:
+    for i, message in enumerate(data['result'].get('messages', []), 1):
+        print(f"\n  Message {i}:")
+        print(f"    Role: {message.get('role', 'N/A')}")
+        if 'content' in message and 'text' in message['content']:
+            print(f"    Content: {message['content']['text']}")
+else:
+    print("No prompt data found or invalid response format")
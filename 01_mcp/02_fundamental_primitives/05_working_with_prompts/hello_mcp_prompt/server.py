@@ -12,13 +12,45 @@ docs = {
 
 mcp = FastMCP(name="hello-mcp-prompt", stateless_http=True)
 
+@mcp.resource(
+    "docs://documents",
+    mime_type="application/json"
+)
+def list_docs() -> list[str]:
+    return list(docs.keys())
+
+@mcp.resource(
+    "docs://{doc_id}",
+    mime_type="text/plain"
+)
+def get_doc(doc_id: str) -> str:
+    if doc_id not in docs:
+        raise ValueError(f"Doc with id {doc_id} not found")
+    return docs[doc_id]
+
+
+def resolve_document(doc_content: str | None, doc_uri: str | None) -> str:
+    """Return the document passed inline, or the one a docs://{doc_id} URI names."""
+    if (doc_content is None) == (doc_uri is None):
+        raise ValueError("Pass exactly one of doc_content and doc_uri")
+    if doc_content is not None:
+        return doc_content
+    # Only a single document is accepted, not the listing or any other resource
+    doc_id = doc_uri.removeprefix("docs://")
+    if not doc_uri.startswith("docs://") or not doc_id or "/" in doc_id or doc_id not in docs:
+        raise ValueError(f"doc_uri must be docs://{{doc_id}} for an existing document, not {doc_uri!r}")
+    return docs[doc_id]
+
+
 @mcp.prompt(
     name="format",
     description="Rewrites the contents of the document in Markdown format.",
 )
 def format_document(
-    doc_content: str = Field(description="Contents of the document to format"),
+    doc_content: str | None = Field(default=None, description="Contents of the document to format"),
+    doc_uri: str | None = Field(default=None, description="URI of the document to format, e.g. docs://plan.md, instead of its contents"),
 ) -> list[base.Message]:
+    doc_content = resolve_document(doc_content, doc_uri)
     prompt = f"""
     Your goal is to reformat a document to be written with markdown syntax.
 
@@ -38,7 +70,11 @@ def format_document(
     name="summarize",
     description="Summarizes the contents of the document."
 )
-def summarize_document(doc_content: str = Field(description="Contents of the document to summarize")) -> list[PromptMessage]:
+def summarize_document(
+    doc_content: str | None = Field(default=None, description="Contents of the document to summarize"),
+    doc_uri: str | None = Field(default=None, description="URI of the document to summarize, e.g. docs://plan.md, instead of its contents"),
+) -> list[PromptMessage]:
+    doc_content = resolve_document(doc_content, doc_uri)
 
     prompt_text = f"""
     Your goal is to summarize the contents of the document.
@@ -0,0 +1,169 @@
+"""
+Micro-benchmarks for the resumption event store.
+
+Reconnect latency: the store is filled with a growing number of streams and
+a client resumes one stream after missing its last few events. The time per
+replay should stay flat no matter how many other streams the server holds.
+
+Store throughput: events are offered to each store at a fixed rate for one
+second. The table shows the rate each store sustained and the CPU time it
+consumed doing so, batched commits included.
+
+Compression cost: tool results of growing size are stored with and without
+zlib compression. The table shows the store and replay time per event, the
+memory the events occupy and the compression ratio.
+
+Run with: uv run python benchmark.py
+"""
+
+import asyncio
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from mcp.types import JSONRPCMessage, JSONRPCNotification, JSONRPCResponse
+
+from memory_store import InMemoryEventStore
+from sqlite_store import SQLiteEventStore
+
+
+def make_message(text: str) -> JSONRPCMessage:
+    """Build a small log notification like the ones a tool sends."""
+    return JSONRPCMessage(
+        JSONRPCNotification(
+            jsonrpc="2.0",
+            method="notifications/message",
+            params={"level": "info", "data": text},
+        )
+    )
+
+
+def make_result(size: int) -> JSONRPCMessage:
+    """Build a tool result holding roughly `size` bytes of document text."""
+    rng = random.Random(size)
+    words = ["event", "stream", "resume", "session", "replay", "client", "server",
+             "progress", "result", "document", "weather", "forecast", "sunny", "Tokyo"]
+    text = " ".join(rng.choice(words) for _ in range(size // 7))
+    return JSONRPCMessage(
+        JSONRPCResponse(
+            jsonrpc="2.0",
+            id=1,
+            result={"content": [{"type": "text", "text": text}], "isError": False},
+        )
+    )
+
+
+async def reconnect_latency(
+    num_streams: int,
+    events_per_stream: int = 50,
+    missed_events: int = 10,
+    rounds: int = 500,
+) -> tuple[float, int]:
+    """Return the mean replay time in microseconds and the events replayed."""
+    store = InMemoryEventStore(max_events_per_stream=100)
+    message = make_message("background traffic")
+
+    for stream in range(num_streams):
+        for _ in range(events_per_stream):
+            await store.store_event(f"stream-{stream}", message)
+
+    # The resuming client saw the first event and missed the rest
+    event_ids = [
+        await store.store_event("resumed-stream", make_message("tool output"))
+        for _ in range(missed_events + 1)
+    ]
+
+    replayed = 0
+
+    async def send(_event) -> None:
+        nonlocal replayed
+        replayed += 1
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        await store.replay_events_after(event_ids[0], send)
+    elapsed = time.perf_counter() - start
+
+    return elapsed / rounds * 1e6, replayed // rounds
+
+
+async def store_throughput(store, rate: int, duration: float = 1.0) -> tuple[float, float]:
+    """Offer `rate` events/s to the store; return achieved events/s and CPU share."""
+    message = make_message("x" * 200)
+    stored = 0
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    while (elapsed := time.perf_counter() - start) < duration:
+        for _ in range(int(rate * elapsed) - stored):
+            await store.store_event(f"stream-{stored % 64}", message)
+            stored += 1
+        # Yield so batched commits (scheduled with call_later) get to run
+        await asyncio.sleep(0.001)
+    elapsed = time.perf_counter() - start
+    return stored / elapsed, (time.process_time() - cpu_start) / elapsed
+
+
+async def compression_cost(
+    size: int, compress: bool, events: int = 200
+) -> tuple[float, float, int, float]:
+    """Return store µs/event, replay µs/event, bytes held and compression ratio."""
+    store = InMemoryEventStore(
+        max_events_per_stream=events + 1,
+        compress_threshold=4096 if compress else None,
+    )
+    message = make_result(size)
+    first_id = await store.store_event("results", make_message("start"))
+
+    start = time.perf_counter()
+    for _ in range(events):
+        await store.store_event("results", message)
+    store_micros = (time.perf_counter() - start) / events * 1e6
+
+    async def send(event) -> None:
+        # The transport serializes every replayed message exactly like this
+        event.message.model_dump_json(by_alias=True, exclude_none=True)
+
+    start = time.perf_counter()
+    await store.replay_events_after(first_id, send)
+    replay_micros = (time.perf_counter() - start) / events * 1e6
+
+    return store_micros, replay_micros, store.total_bytes, store.metrics.compression_ratio
+
+
+async def main():
+    print("Reconnect latency vs. number of streams")
+    print(f"{'streams':>10} {'events held':>12} {'replayed':>9} {'µs/replay':>10}")
+    for num_streams in (10, 100, 1_000, 10_000):
+        micros, replayed = await reconnect_latency(num_streams)
+        print(f"{num_streams:>10} {num_streams * 50:>12} {replayed:>9} {micros:>10.1f}")
+
+    print()
+    print("Store throughput (events/s offered vs. sustained)")
+    print(f"{'store':>10} {'offered':>9} {'sustained':>10} {'CPU':>6}")
+    with tempfile.TemporaryDirectory() as directory:
+        for rate in (1_000, 10_000, 100_000):
+            stores = {
+                "memory": InMemoryEventStore(),
+                "sqlite": SQLiteEventStore(Path(directory) / f"events-{rate}.db"),
+            }
+            for name, store in stores.items():
+                sustained, cpu = await store_throughput(store, rate)
+                print(f"{name:>10} {rate:>9} {sustained:>10.0f} {cpu:>6.0%}")
+                if isinstance(store, SQLiteEventStore):
+                    store.close()
+
+    print()
+    print("Compression cost (200 tool results per size)")
+    print(f"{'size':>8} {'zlib':>5} {'µs/store':>9} {'µs/replay':>10} {'bytes held':>11} {'ratio':>6}")
+    for size in (1_024, 16_384, 262_144):
+        for compress in (False, True):
+            store_micros, replay_micros, held, ratio = await compression_cost(size, compress)
+            print(
+                f"{size:>8} {'on' if compress else 'off':>5} {store_micros:>9.1f} "
+                f"{replay_micros:>10.1f} {held:>11} {ratio:>6.1f}"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,8 +1,109 @@
 import httpx
 import json
 import asyncio
+import random
+import re
+from collections import OrderedDict
+from dataclasses import dataclass
 from typing import Optional
 
+# SSE lines end in CRLF, LF or CR only. str.splitlines would also break on
+# characters such as U+2028 that JSON carries unescaped inside `data:` fields.
+LINE_BREAK = re.compile(r"\r\n|\r|\n")
+
+
+@dataclass
+class SSEEvent:
+    """A single server-sent event; `id` is only set if the event carried one."""
+    event: str
+    data: str
+    id: Optional[str] = None
+
+
+class SSEParser:
+    """Incremental parser for `text/event-stream` bodies.
+
+    Feed it chunks as they arrive: it returns the events completed by each
+    chunk and only buffers the unfinished line and event, so lines split
+    across chunks and multi-line `data:` fields are handled without ever
+    holding the whole body.
+    """
+
+    def __init__(self):
+        self._line = ""
+        self._event = ""
+        self._data: list[str] = []
+        self._id: Optional[str] = None
+        # Per the SSE spec the last event ID persists across events
+        self.last_event_id: Optional[str] = None
+
+    def feed(self, chunk: str) -> list[SSEEvent]:
+        events = []
+        text = self._line + chunk
+        # A trailing "\r" may be the first half of a "\r\n" split across chunks
+        end = len(text) - 1 if text.endswith("\r") else len(text)
+        start = 0
+        for match in LINE_BREAK.finditer(text, 0, end):
+            event = self._process_line(text[start : match.start()])
+            start = match.end()
+            if event:
+                events.append(event)
+        self._line = text[start:]
+        return events
+
+    def close(self) -> list[SSEEvent]:
+        """Flush a final event that was not followed by a blank line."""
+        events = self.feed("\n\n")
+        self._line = ""
+        return events
+
+    def _process_line(self, line: str) -> Optional[SSEEvent]:
+        if not line:
+            # A blank line dispatches the event being built
+            event = None
+            if self._data:
+                event = SSEEvent(self._event or "message", "\n".join(self._data), self._id)
+            self._event, self._data, self._id = "", [], None
+            return event
+        if line.startswith(":"):
+            return None  # comment / keep-alive
+        field, _, value = line.partition(":")
+        value = value[1:] if value.startswith(" ") else value
+        if field == "data":
+            self._data.append(value)
+        elif field == "event":
+            self._event = value
+        elif field == "id" and "\0" not in value:
+            self._id = self.last_event_id = value
+        return None
+
+
+async def aiter_sse(response: httpx.Response):
+    """Yield server-sent events from a streaming response as chunks arrive."""
+    parser = SSEParser()
+    async for chunk in response.aiter_text():
+        for event in parser.feed(chunk):
+            yield event
+    for event in parser.close():
+        yield event
+
+
+class SeenEventIds:
+    """Bounded set of recently seen event IDs used to drop replayed duplicates."""
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self._ids: OrderedDict[str, None] = OrderedDict()
+
+    def add(self, event_id: str) -> bool:
+        """Remember an event ID; returns False if it was already seen."""
+        if event_id in self._ids:
+            return False
+        self._ids[event_id] = None
+        if len(self._ids) > self.max_size:
+            self._ids.popitem(last=False)
+        return True
+
 
 class SimpleMCPClient:
     """MCP client focused on demonstrating resumption clearly."""
@@ -16,30 +117,36 @@ class SimpleMCPClient:
             "Accept": "application/json, text/event-stream"
         }
         self.client: Optional[httpx.AsyncClient] = None
-
-    def extract_event_id_from_sse(self, sse_response: str) -> Optional[str]:
-        """Extract event ID from SSE response for resumption tracking."""
-        lines = sse_response.split('\n')
-
-        # Look for explicit 'id: ' line in SSE format
-        for line in lines:
-            if line.startswith('id: '):
-                event_id = line[4:].strip()
-                print(f"📋 Found Event ID: {event_id}")
-                return event_id
-
-        return None
-
-    def parse_sse_data(self, sse_response: str) -> Optional[dict]:
-        """Parse data from SSE response."""
-        for line in sse_response.split('\n'):
-            if line.startswith('data: '):
-                try:
-                    return json.loads(line[6:])  # Remove 'data: ' prefix
-                except json.JSONDecodeError as e:
-                    print(f"Failed to parse SSE data: {e}")
-                    return None
-        return None
+        # Replays after a reconnect may repeat events we already handled
+        self.seen_event_ids = SeenEventIds()
+        self.events_received = 0
+
+    def handle_sse_event(self, sse: SSEEvent) -> Optional[dict]:
+        """Track the event ID of an SSE event and parse its JSON-RPC message.
+
+        Returns None for duplicates, non-message events, invalid JSON and
+        JSON that is not an object.
+        """
+        if sse.id:
+            if not self.seen_event_ids.add(sse.id):
+                print(f"   → Skipping duplicate event {sse.id}")
+                return None
+            self.last_event_id = sse.id
+            print(f"📋 Event ID: {sse.id}")
+        self.events_received += 1
+
+        if sse.event != "message":
+            print(f"   → Non-message event: {sse.event}")
+            return None
+        try:
+            message = json.loads(sse.data)
+        except json.JSONDecodeError as e:
+            print(f"❌ SSE JSON decode error: {e}")
+            return None
+        if not isinstance(message, dict):
+            print(f"❌ SSE data is not a JSON-RPC message: {sse.data[:100]}")
+            return None
+        return message
 
     async def initialize(self) -> bool:
         """Step 1: Initialize MCP connection (using persistent client)"""
@@ -87,13 +194,11 @@ class SimpleMCPClient:
                 self.headers["mcp-session-id"] = self.session_id
                 print(f"✅ Session ID: {self.session_id}")
 
-            # Track event ID for resumption
-            event_id = self.extract_event_id_from_sse(response.text)
-            if event_id:
-                self.last_event_id = event_id
-
-            # Parse initialization result
-            data = self.parse_sse_data(response.text)
+            # Track event ID for resumption and parse initialization result
+            parser = SSEParser()
+            data = None
+            for sse in parser.feed(response.text) + parser.close():
+                data = self.handle_sse_event(sse) or data
             if data and 'result' in data:
                 print("✅ MCP initialized successfully!")
                 return True
@@ -182,18 +287,14 @@ class SimpleMCPClient:
                 if "text/event-stream" in content_type:
                     print("🌊 Tool call returned SSE stream")
                     # CRITICAL: Wait for at least the first event to capture the stream event ID
-                    from httpx_sse import EventSource
-                    event_source = EventSource(response)
-
-                    # Try to get at least one event for the correct stream event ID
                     event_received = False
-                    async for sse in event_source.aiter_sse():
+                    async for sse in aiter_sse(response):
                         print(
                             f"🔧 Tool call SSE event: '{sse.event}', id: '{sse.id}', data: '{sse.data[:100]}...'")
 
                         # Track event ID for resumption - THIS IS CRITICAL
+                        self.handle_sse_event(sse)
                         if sse.id:
-                            self.last_event_id = sse.id
                             print(f"🔧 ✅ Captured TOOL CALL Event ID: {sse.id}")
                             event_received = True
 
@@ -217,160 +318,131 @@ class SimpleMCPClient:
             print(f"🔧 Last Event ID before error: {self.last_event_id}")
             return "ERROR"
 
-    async def resume_get_stream(self) -> Optional[str]:
-        """Use HTTP GET with Last-Event-ID for TRUE MCP resumption (no new calls)"""
+    async def resume_get_stream(self, request_id: int, idle_timeout: float = 5.0) -> Optional[str]:
+        """Use HTTP GET with Last-Event-ID for TRUE MCP resumption (no new calls)
+
+        Makes one connection attempt and returns the response to `request_id`,
+        or None if the stream went idle or ended before it arrived. Network
+        errors are left to the caller, which decides whether to reconnect.
+        """
         if not self.client:
             print("❌ Client not initialized")
             return None
 
-        print(f"🔄 Starting TRUE MCP resumption via GET with Last-Event-ID...")
-
         headers = self.headers.copy()
         if self.last_event_id:
             headers["Last-Event-ID"] = self.last_event_id
             print(f"   → Using Last-Event-ID: {self.last_event_id}")
             print(f"   → MCP Spec: GET request should replay events, NOT make new calls")
 
-        try:
-            print(f"   → GET {self.base_url} (TRUE resumption)")
-
-            # Use HTTP GET with ONLY Last-Event-ID header (MCP spec compliant)
-            # NO JSON body - server should replay events from event store
-            async with self.client.stream(
-                "GET",
-                self.base_url,
-                headers=headers
-            ) as response:
-
-                print(f"   → Response status: {response.status_code}")
-                print(f"   → Response headers: {dict(response.headers)}")
-
-                if response.status_code != 200:
-                    print(f"❌ GET resumption failed: {response.status_code}")
-                    return None
-
-                content_type = response.headers.get("content-type", "").lower()
-
-                if "text/event-stream" in content_type:
-                    print("✅ GET SSE stream established for resumption")
-
-                    # Use EventSource like the official client
-                    from httpx_sse import EventSource
-                    event_source = EventSource(response)
+        print(f"   → GET {self.base_url} (TRUE resumption)")
 
-                    # Add timeout to prevent hanging
-                    result_found = False
-                    timeout_seconds = 10
+        # Use HTTP GET with ONLY Last-Event-ID header (MCP spec compliant)
+        # NO JSON body - server should replay events from event store.
+        # The read timeout turns a silent stream into a reconnect.
+        async with self.client.stream(
+            "GET",
+            self.base_url,
+            headers=headers,
+            timeout=httpx.Timeout(30.0, read=idle_timeout),
+        ) as response:
+            print(f"   → Response status: {response.status_code}")
 
-                    async def wait_for_result():
-                        nonlocal result_found
-                        async for sse in event_source.aiter_sse():
-                            print(
-                                f"   → Received SSE event: '{sse.event}', id: '{sse.id}', data: '{sse.data[:100]}...'")
-
-                            if sse.event == "message":
-                                try:
-                                    parsed = json.loads(sse.data)
-                                    print(f"   → Parsed SSE data: {parsed}")
-
-                                    # Track event ID
-                                    if sse.id:
-                                        self.last_event_id = sse.id
-                                        print(
-                                            f"   → Updated Event ID: {sse.id}")
-
-                                    # Handle result from resumption
-                                    if "result" in parsed:
-                                        print("✅ Got result from resumption!")
-                                        result_found = True
-                                        return json.dumps(parsed)
-
-                                    # Handle other message types
-                                    elif parsed.get("method"):
-                                        print(
-                                            f"   → Method: {parsed.get('method')}")
-
-                                except json.JSONDecodeError as e:
-                                    print(f"❌ SSE JSON decode error: {e}")
-
-                            # Handle other event types
-                            elif sse.event:
-                                print(f"   → Non-message event: {sse.event}")
-
-                        return None
-
-                    # Wait for result with timeout
-                    try:
-                        result = await asyncio.wait_for(wait_for_result(), timeout=timeout_seconds)
-                        if result:
-                            return result
-                    except asyncio.TimeoutError:
-                        print(
-                            f"⏰ SSE stream timed out after {timeout_seconds} seconds")
-
-                    if not result_found:
-                        print("⚠️ SSE stream ended without receiving result")
-                    return None
-
-                else:
-                    # Handle JSON response
-                    print("✅ GET stream with JSON response")
-                    content = await response.aread()
-                    response_text = content.decode('utf-8')
-                    print(f"   → Response text: {response_text[:200]}...")
-
-                    # Track any new event ID
-                    event_id = self.extract_event_id_from_sse(response_text)
-                    if event_id:
-                        self.last_event_id = event_id
-
-                    # Try to parse as JSON
-                    try:
-                        parsed = json.loads(response_text)
-                        if "result" in parsed:
-                            print("✅ Got JSON result from resumption!")
-                            return response_text
-                    except json.JSONDecodeError:
-                        pass
-
-                    # Try to parse SSE data
-                    data = self.parse_sse_data(response_text)
-                    if data and 'result' in data:
-                        print("✅ Got SSE result from resumption!")
-                        return response_text
-
-                    # Return the raw response
-                    print("✅ Got raw response from resumption!")
-                    return response_text
-
-        except Exception as e:
-            print(f"💥 GET stream resumption error: {e}")
-            import traceback
-            traceback.print_exc()
+            if response.status_code != 200:
+                print(f"❌ GET resumption failed: {response.status_code}")
+                response.raise_for_status()
+
+            content_type = response.headers.get("content-type", "").lower()
+            if "text/event-stream" in content_type:
+                print("✅ GET SSE stream established for resumption")
+                async for sse in aiter_sse(response):
+                    print(f"   → Received SSE event: '{sse.event}', id: '{sse.id}', data: '{sse.data[:100]}...'")
+                    message = self.handle_sse_event(sse)
+                    if not message:
+                        continue
+
+                    # Handle result from resumption
+                    if message.get("id") == request_id and ("result" in message or "error" in message):
+                        print("✅ Got result from resumption!")
+                        return json.dumps(message)
+                    elif message.get("method"):
+                        print(f"   → Method: {message.get('method')}")
+
+                print("⚠️ SSE stream ended without receiving result")
+                return None
+
+            # Handle JSON response
+            print("✅ GET stream with JSON response")
+            content = await response.aread()
+            try:
+                message = json.loads(content)
+            except json.JSONDecodeError:
+                print(f"   → Unexpected response: {content[:200]!r}")
+                return None
+            if not isinstance(message, dict):
+                print(f"   → Unexpected response: {content[:200]!r}")
+                return None
+            if message.get("id") == request_id and "result" in message:
+                print("✅ Got JSON result from resumption!")
+                return json.dumps(message)
             return None
 
-    async def resume_and_retry(self, tool_name: str, arguments: dict) -> Optional[dict | str]:
-        """Step 3: TRUE MCP RESUMPTION - Replay events, don't make new calls"""
+    async def resume_and_retry(
+        self,
+        tool_name: str,
+        arguments: dict,
+        request_id: int = 2,
+        max_attempts: int = 8,
+        base_delay: float = 0.25,
+        max_delay: float = 8.0,
+        idle_timeout: float = 5.0,
+    ) -> Optional[dict | str]:
+        """Step 3: TRUE MCP RESUMPTION - Replay events, don't make new calls
+
+        Reconnects with Last-Event-ID until the result of `request_id` arrives.
+        A connection that delivered new events is retried immediately; one
+        that did not, or that the server failed with a 5xx status, backs off
+        exponentially with full jitter, so many clients dropped together do
+        not reconnect in lockstep. A 4xx status ends the resumption.
+        """
         print(
             f"\n🔄 RESUMING connection for {tool_name} (MCP spec compliant)...")
 
-        # Save current state
-        saved_event_id = self.last_event_id
-        saved_session_id = self.session_id
-
-        print(f"   → Saved Event ID: {saved_event_id}")
-        print(f"   → Saved Session ID: {saved_session_id}")
+        print(f"   → Saved Event ID: {self.last_event_id}")
+        print(f"   → Saved Session ID: {self.session_id}")
         print(f"   → MCP Spec: GET with Last-Event-ID should replay cached events")
 
-        if saved_event_id:
-            print(f"🔄 Resuming from Event ID: {saved_event_id}")
-        else:
+        if not self.last_event_id:
             print("❌ No Event ID to resume from")
             return None
 
-        # Use HTTP GET with Last-Event-ID to replay events (MCP spec)
-        result = await self.resume_get_stream()
-        return result
+        attempt = 0
+        while attempt < max_attempts:
+            received_before = self.events_received
+            try:
+                result = await self.resume_get_stream(request_id, idle_timeout)
+                if result:
+                    return result
+            except httpx.HTTPStatusError as e:
+                if e.response.is_client_error:
+                    # The server no longer knows the session or the event
+                    print(f"❌ Resumption refused: {e.response.status_code}")
+                    return None
+                print(f"⚠️ Server error: {e.response.status_code}")
+            except httpx.TransportError as e:
+                print(f"⚠️ Connection dropped: {e!r}")
+
+            if self.events_received > received_before:
+                attempt = 0
+                delay = 0.0
+            else:
+                attempt += 1
+                delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            print(f"🔁 Reconnecting in {delay:.2f}s (attempt {attempt}/{max_attempts})")
+            await asyncio.sleep(delay)
+
+        print("❌ Gave up resuming")
+        return None
 
     async def cleanup(self):
         """Close the HTTP client"""
@@ -408,10 +480,8 @@ async def main():
         print("🚀 Tool call result: ", result)
         print(f"🔧 Event ID from tool call: {client.last_event_id}")
 
-        # Wait for server to complete task
-        print("⏰ Waiting 7 seconds for server to complete the 6-second tool execution...")
-        await asyncio.sleep(7)
-
+        # No need to wait for the server: the reconnect loop keeps resuming
+        # until the tool result has been stored and replayed
         # Approach 1: SPEC-COMPLIANT (GET + Last-Event-ID)
         print("\n" + "-" * 60)
         print("APPROACH 1: MCP SPEC-COMPLIANT (GET + Last-Event-ID)")
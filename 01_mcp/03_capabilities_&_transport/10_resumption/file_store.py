@@ -0,0 +1,453 @@
+"""
+Segment-file event store for resumability that survives server restarts.
+
+Events are appended to segment files on disk and located through a small
+in-memory offset index. Replays read sealed segments back through memory
+maps and the active one with `os.pread`, so buffered events do not sit on
+the Python heap, and a background task deletes segments whose events are
+all older than the retention period. File I/O runs on one worker thread,
+so a slow disk never stalls the event loop.
+"""
+
+import asyncio
+import logging
+import mmap
+import os
+import struct
+import time
+from array import array
+from bisect import bisect_right
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from mcp.server.streamable_http import (
+    EventCallback,
+    EventId,
+    EventMessage,
+    EventStore,
+    StreamId,
+)
+from mcp.types import JSONRPCMessage
+
+from memory_store import EncodedMessage, ReplayScope, StreamKey, current_session_key, stream_token, token_matches
+from metrics import EventStoreMetrics
+
+logger = logging.getLogger(__name__)
+
+# Events read from disk per trip to the worker thread during a replay
+REPLAY_BATCH = 64
+
+# payload length, seq, tick, timestamp, session key length, stream ID length;
+# the header is followed by the session key, the stream ID and the payload
+RECORD_HEADER = struct.Struct("<IQQdHH")
+SEGMENT_SUFFIX = ".seg"
+
+
+@dataclass
+class Segment:
+    """
+    One append-only segment file.
+
+    The active segment keeps its file descriptor open and is read with
+    `os.pread`; only sealed segments are memory-mapped, once, as mapping
+    the active one again every time it grows would cost a replay the size
+    of the segment.
+    """
+
+    number: int
+    path: Path
+    size: int = 0
+    last_write: float = 0.0
+    fd: int | None = None
+    view: mmap.mmap | None = None
+
+
+@dataclass
+class StreamIndex:
+    """
+    Offset index for one stream.
+
+    Sequence numbers within a stream are contiguous, so the event with
+    sequence number `first_seq + i` lives at `locations[i]`, packed as
+    `segment << 32 | offset`.
+    """
+
+    token: str
+    first_seq: int = 0
+    locations: array = field(default_factory=lambda: array("Q"))
+    ticks: array = field(default_factory=lambda: array("Q"))
+
+    @property
+    def next_seq(self) -> int:
+        return self.first_seq + len(self.locations)
+
+
+def _event_id(token: str, location: int) -> EventId:
+    return f"{token}-{location >> 32}-{location & 0xFFFFFFFF}"
+
+
+class SegmentFileEventStore(EventStore):
+    """
+    Disk-backed implementation of the EventStore interface.
+
+    Appends, reads and deletions of segment files queue up in order on a
+    single worker thread, so a replay reads every event indexed before it.
+
+    Event IDs encode the segment and byte offset of the event, so they stay
+    valid across restarts: on startup the store rebuilds its offset index by
+    scanning the segment files left in `directory`. They are prefixed with
+    the stream's token (see `stream_token`), derived from the session key
+    stored with each record, so a client cannot replay another session's
+    stream by guessing locations.
+    """
+
+    def __init__(
+        self,
+        directory: str | Path,
+        segment_max_bytes: int = 4 * 1024 * 1024,
+        retention_seconds: float = 3600.0,
+        compaction_interval: float = 60.0,
+        replay_scope: ReplayScope = "stream",
+        metrics: EventStoreMetrics | None = None,
+    ):
+        """Initialize the event store.
+
+        Args:
+            directory: Directory holding the segment files
+            segment_max_bytes: Size at which the active segment is sealed
+            retention_seconds: How long sealed segments are kept after their last write
+            compaction_interval: Seconds between background compaction runs
+            replay_scope: "stream" to replay only the resuming stream, or
+                "session" to include the session's other streams as well
+            metrics: Metrics to update; a new set is created if omitted
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.segment_max_bytes = segment_max_bytes
+        self.retention_seconds = retention_seconds
+        self.compaction_interval = compaction_interval
+        self.replay_scope = replay_scope
+        self.metrics = metrics or EventStoreMetrics()
+        self.metrics.add_gauge(
+            "bytes_held",
+            "Bytes held in segment files.",
+            lambda: sum(segment.size for segment in self.segments.values()),
+        )
+
+        self.segments: dict[int, Segment] = {}
+        self.streams: dict[StreamKey, StreamIndex] = {}
+        # session key -> IDs of the streams that session has written to
+        self.session_streams: dict[str, set[StreamId]] = {}
+        self.next_tick = 1
+        self._compaction_task: asyncio.Task | None = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="segment-event-store")
+
+        for path in sorted(self.directory.glob(f"*{SEGMENT_SUFFIX}")):
+            self._recover_segment(Segment(number=int(path.stem), path=path))
+
+        self._active: Segment
+        self._open_segment(max(self.segments, default=0) + 1)
+
+    def _segment_path(self, number: int) -> Path:
+        return self.directory / f"{number:012d}{SEGMENT_SUFFIX}"
+
+    def _open_segment(self, number: int) -> None:
+        """Start a new active segment that events are appended to."""
+        path = self._segment_path(number)
+        fd = os.open(path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        self._active = Segment(number=number, path=path, fd=fd)
+        self.segments[number] = self._active
+
+    async def _run(self, function: Callable, *args):
+        """Run file I/O on the store's worker thread."""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    @staticmethod
+    def _append(segment: Segment, record: bytes) -> None:
+        # Writing hands the record to the OS, so it survives a process restart
+        view = memoryview(record)
+        while view:
+            view = view[os.write(segment.fd, view) :]
+
+    @staticmethod
+    def _seal(segment: Segment) -> None:
+        # Only the worker thread touches the descriptor, so reads never race this
+        os.close(segment.fd)
+        segment.fd = None
+
+    def _index_event(
+        self,
+        session_key: str,
+        stream_id: StreamId,
+        seq: int,
+        tick: int,
+        location: int,
+    ) -> None:
+        key = (session_key, stream_id)
+        stream = self.streams.get(key)
+        if stream is None or seq != stream.next_seq:
+            stream = self.streams[key] = StreamIndex(stream_token(session_key, stream_id), first_seq=seq)
+            self.session_streams.setdefault(session_key, set()).add(stream_id)
+        stream.locations.append(location)
+        stream.ticks.append(tick)
+
+    def _recover_segment(self, segment: Segment) -> None:
+        """Rebuild the offset index from a segment left by a previous run."""
+        file_size = segment.path.stat().st_size
+        offset = 0
+        if file_size:
+            with open(segment.path, "rb") as file, mmap.mmap(
+                file.fileno(), 0, access=mmap.ACCESS_READ
+            ) as view:
+                while offset + RECORD_HEADER.size <= file_size:
+                    length, seq, tick, timestamp, session_len, stream_len = (
+                        RECORD_HEADER.unpack_from(view, offset)
+                    )
+                    body = offset + RECORD_HEADER.size
+                    end = body + session_len + stream_len + length
+                    if end > file_size:
+                        break
+                    session_key = view[body : body + session_len].decode()
+                    stream_id = view[body + session_len : body + session_len + stream_len].decode()
+                    self._index_event(session_key, stream_id, seq, tick, segment.number << 32 | offset)
+                    self.next_tick = max(self.next_tick, tick + 1)
+                    segment.last_write = max(segment.last_write, timestamp)
+                    offset = end
+
+        # A record cut short by a crash is dropped so the file ends cleanly
+        if offset < file_size:
+            logger.warning(f"Truncating partial record in {segment.path} at offset {offset}")
+            os.truncate(segment.path, offset)
+        segment.size = offset
+        self.segments[segment.number] = segment
+
+    @staticmethod
+    def _read(segment: Segment, offset: int, length: int) -> bytes:
+        """Read bytes of a segment; runs on the worker thread."""
+        if segment.fd is not None:
+            return os.pread(segment.fd, length, offset)
+        # A sealed segment no longer grows, so it is mapped only once
+        if segment.view is None:
+            with open(segment.path, "rb") as file:
+                segment.view = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return segment.view[offset : offset + length]
+
+    def _read_header(self, location: int) -> tuple[int, int, int, str, StreamId] | None:
+        """Return (payload offset, payload length, seq, session key, stream ID)."""
+        segment = self.segments.get(location >> 32)
+        offset = location & 0xFFFFFFFF
+        if segment is None or offset + RECORD_HEADER.size > segment.size:
+            return None
+        length, seq, _, _, session_len, stream_len = RECORD_HEADER.unpack(
+            self._read(segment, offset, RECORD_HEADER.size)
+        )
+        body = offset + RECORD_HEADER.size
+        payload = body + session_len + stream_len
+        if payload + length > segment.size:
+            return None
+        try:
+            keys = self._read(segment, body, session_len + stream_len)
+            session_key = keys[:session_len].decode()
+            stream_id = keys[session_len:].decode()
+        except UnicodeDecodeError:
+            return None
+        return payload, length, seq, session_key, stream_id
+
+    def _read_messages(self, locations: list[int]) -> list[EncodedMessage | None]:
+        """Read the messages of events; None for those compacted away meanwhile."""
+        messages = []
+        for location in locations:
+            header = self._read_header(location)
+            if header is None:
+                messages.append(None)
+                continue
+            payload, length = header[:2]
+            data = self._read(self.segments[location >> 32], payload, length)
+            messages.append(EncodedMessage(data.decode()))
+        return messages
+
+    async def store_event(
+        self, stream_id: StreamId, message: JSONRPCMessage
+    ) -> EventId:
+        """Appends an event to the active segment and returns its event ID."""
+        session_key = current_session_key()
+        key = (session_key, stream_id)
+        stream = self.streams.get(key)
+        seq = stream.next_seq if stream else 0
+        tick = self.next_tick
+        self.next_tick += 1
+
+        session_bytes = session_key.encode()
+        stream_bytes = stream_id.encode()
+        payload = EncodedMessage.encode(message).json.encode()
+        now = time.time()
+        record = b"".join(
+            (
+                RECORD_HEADER.pack(len(payload), seq, tick, now, len(session_bytes), len(stream_bytes)),
+                session_bytes,
+                stream_bytes,
+                payload,
+            )
+        )
+
+        if self._active.size and self._active.size + len(record) > self.segment_max_bytes:
+            # Appends already queued still go to the old file before it is closed
+            self._executor.submit(self._seal, self._active)
+            self._open_segment(self._active.number + 1)
+
+        # The offset is taken now; the worker thread appends in the same order
+        segment = self._active
+        location = segment.number << 32 | segment.size
+        segment.size += len(record)
+        segment.last_write = now
+        await self._run(self._append, segment, record)
+
+        self._index_event(session_key, stream_id, seq, tick, location)
+        self.metrics.record_store(len(payload))
+        self._start_compaction()
+
+        event_id = _event_id(self.streams[key].token, location)
+        logger.debug(f"🏪 Stored event {event_id} in stream {stream_id}")
+        return event_id
+
+    async def replay_events_after(
+        self,
+        last_event_id: EventId,
+        send_callback: EventCallback,
+    ) -> StreamId | None:
+        """Replays events written after the specified event ID within the replay scope."""
+        logger.info(f"🔄 Replaying events after {last_event_id}")
+        started = time.perf_counter()
+        token, _, last_location = last_event_id.partition("-")
+        try:
+            segment_number, offset = (int(part) for part in last_location.split("-"))
+            location = segment_number << 32 | offset
+            header = await self._run(self._read_header, location) if 0 <= offset <= 0xFFFFFFFF else None
+        except ValueError:
+            header = None
+
+        # Only trust the header if the index agrees the event starts there
+        stream = None
+        if header is not None:
+            _, _, seq, session_key, stream_id = header
+            stream = self.streams.get((session_key, stream_id))
+        position = seq - stream.first_seq if stream else -1
+        if (
+            stream is None
+            or not token_matches(token, stream.token)
+            or not 0 <= position < len(stream.locations)
+            or stream.locations[position] != location
+        ):
+            logger.warning(f"Event ID {last_event_id} not found in store")
+            self.metrics.record_replay(None, time.perf_counter() - started)
+            return None
+
+        last_tick = stream.ticks[position]
+        replay = [
+            (tick, location, stream.token)
+            for tick, location in zip(stream.ticks[position + 1 :], stream.locations[position + 1 :])
+        ]
+
+        if self.replay_scope == "session":
+            for other_id in self.session_streams[session_key]:
+                other = self.streams.get((session_key, other_id))
+                if other_id == stream_id or other is None or not other.ticks or other.ticks[-1] <= last_tick:
+                    continue
+                start = bisect_right(other.ticks, last_tick)
+                replay.extend(
+                    (tick, location, other.token)
+                    for tick, location in zip(other.ticks[start:], other.locations[start:])
+                )
+            replay.sort()
+
+        logger.info(
+            f"🔄 Found {len(replay)} events to replay "
+            f"(last event stream: {stream_id}, scope: {self.replay_scope})"
+        )
+
+        for start in range(0, len(replay), REPLAY_BATCH):
+            batch = replay[start : start + REPLAY_BATCH]
+            messages = await self._run(self._read_messages, [location for _, location, _ in batch])
+            for (_, event_location, event_token), message in zip(batch, messages):
+                if message is None:
+                    # The segment was compacted away while we were replaying
+                    continue
+                await send_callback(EventMessage(message, _event_id(event_token, event_location)))
+        self.metrics.record_replay(len(replay), time.perf_counter() - started)
+
+        return stream_id
+
+    def _start_compaction(self) -> None:
+        if self._compaction_task is None:
+            self._compaction_task = asyncio.get_running_loop().create_task(
+                self._compact_periodically()
+            )
+
+    async def _compact_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.compaction_interval)
+            try:
+                self.compact()
+            except OSError as e:
+                logger.warning(f"Event store compaction failed: {e}")
+
+    def compact(self, now: float | None = None) -> int:
+        """Delete sealed segments past the retention period; returns how many were removed."""
+        cutoff = (time.time() if now is None else now) - self.retention_seconds
+        expired = sorted(
+            number
+            for number, segment in self.segments.items()
+            if segment is not self._active and segment.last_write < cutoff
+        )
+        if not expired:
+            return 0
+
+        # The files go once reads queued before them are done
+        removed = [self.segments.pop(number) for number in expired]
+        self._executor.submit(self._delete_segments, removed)
+
+        # Segments expire oldest first, so each stream loses a prefix of its index
+        newest_expired = expired[-1]
+        for key, stream in list(self.streams.items()):
+            dropped = bisect_right(stream.locations, (newest_expired << 32) | 0xFFFFFFFF)
+            self.metrics.record_evictions(dropped)
+            if dropped == len(stream.locations):
+                del self.streams[key]
+                session_key, stream_id = key
+                self.session_streams[session_key].discard(stream_id)
+                if not self.session_streams[session_key]:
+                    del self.session_streams[session_key]
+            elif dropped:
+                del stream.locations[:dropped]
+                del stream.ticks[:dropped]
+                stream.first_seq += dropped
+
+        logger.info(f"🧹 Compacted {len(expired)} expired segments")
+        return len(expired)
+
+    @staticmethod
+    def _delete_segments(segments: list[Segment]) -> None:
+        for segment in segments:
+            if segment.view is not None:
+                segment.view.close()
+            try:
+                segment.path.unlink(missing_ok=True)
+            except OSError as e:
+                logger.warning(f"Could not delete segment {segment.path}: {e}")
+
+    def close(self) -> None:
+        """Stop background compaction and release file handles and memory maps."""
+        if self._compaction_task is not None:
+            self._compaction_task.cancel()
+            self._compaction_task = None
+        # Let queued appends and reads finish first
+        self._executor.shutdown()
+        for segment in self.segments.values():
+            if segment.fd is not None:
+                os.close(segment.fd)
+                segment.fd = None
+            if segment.view is not None:
+                segment.view.close()
+                segment.view = None
@@ -5,32 +5,212 @@ This is a simple implementation intended for examples and testing,
 not for production use where a persistent storage solution would be more appropriate.
 """
 
+import asyncio
 import logging
-from collections import deque
-from dataclasses import dataclass
+import zlib
+from bisect import bisect_right
+from collections import OrderedDict, deque
+from collections.abc import Awaitable, Callable
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from hashlib import blake2b
+from hmac import compare_digest
+from itertools import count, islice
+from operator import attrgetter
+from time import monotonic, perf_counter
+from typing import Literal
 from uuid import uuid4
 
 from mcp.server.streamable_http import (
+    GET_STREAM_KEY,
     EventCallback,
     EventId,
     EventMessage,
     EventStore,
     StreamId,
 )
-from mcp.types import JSONRPCMessage
+from mcp.types import (
+    ErrorData,
+    JSONRPCError,
+    JSONRPCMessage,
+    JSONRPCNotification,
+    ProgressToken,
+)
+
+from metrics import EventStoreMetrics
 
 logger = logging.getLogger(__name__)
 
+# The SDK shares one event store between all sessions and reuses request IDs
+# (and therefore stream IDs) across them, but each session routes all of its
+# outgoing messages from a single task. A context variable set on first use
+# inside that task tags every event of the session with the same key.
+_session_key: ContextVar[str] = ContextVar("event_store_session_key")
 
-@dataclass
+ReplayScope = Literal["stream", "session"]
+StreamKey = tuple[str, StreamId]
+EventBatchCallback = Callable[[list[EventMessage]], Awaitable[None]]
+
+# JSON-RPC reserves -32000 to -32099 for implementation-defined server errors
+RESYNC_REQUIRED = -32001
+
+
+def current_session_key() -> str:
+    """Return the session key of the calling task, creating one on first use."""
+    try:
+        return _session_key.get()
+    except LookupError:
+        session_key = uuid4().hex
+        _session_key.set(session_key)
+        return session_key
+
+
+def stream_token(session_key: str, stream_id: StreamId) -> str:
+    """Return the token that the event IDs of a stream carry.
+
+    It is keyed on the session key, which never leaves the server, so a
+    client cannot derive the IDs of another session's streams from its own.
+    """
+    return blake2b(stream_id.encode(), key=session_key.encode()[:64], digest_size=12).hexdigest()
+
+
+def token_matches(token: str, expected: str) -> bool:
+    """Compare a token taken from a client's event ID in constant time."""
+    # compare_digest rejects non-ASCII strings, and the header is client input
+    return compare_digest(token.encode(), expected.encode())
+
+
+def progress_token(message: JSONRPCMessage) -> ProgressToken | None:
+    """Return the token of a progress notification, or None for any other message."""
+    root = message.root
+    if isinstance(root, JSONRPCNotification) and root.method == "notifications/progress":
+        return (root.params or {}).get("progressToken")
+    return None
+
+
+def resync_required(stream_id: StreamId, detail: str) -> JSONRPCMessage:
+    """Build the error that tells a client to re-issue its request instead of resuming."""
+    # The SDK names each request stream after str(request.id)
+    request_id = int(stream_id) if stream_id.isdigit() else stream_id
+    return JSONRPCMessage(
+        JSONRPCError(
+            jsonrpc="2.0",
+            id=request_id,
+            error=ErrorData(code=RESYNC_REQUIRED, message=f"Resync required: {detail}"),
+        )
+    )
+
+
+class EncodedMessage:
+    """
+    A JSON-RPC message kept in the encoded form it is sent in.
+
+    On replay the transport only calls `model_dump_json()` on each message to
+    build the SSE `data:` field, so returning the text encoded at store time
+    skips pydantic entirely and allocates nothing per replayed event.
+    """
+
+    __slots__ = ("json",)
+
+    def __init__(self, json: str):
+        self.json = json
+
+    @classmethod
+    def encode(cls, message: JSONRPCMessage) -> "EncodedMessage":
+        return cls(message.model_dump_json(by_alias=True, exclude_none=True))
+
+    def model_dump_json(self, **_kwargs) -> str:
+        return self.json
+
+    def decode(self) -> JSONRPCMessage:
+        return JSONRPCMessage.model_validate_json(self.json)
+
+
+class CompressedMessage:
+    """
+    An encoded JSON-RPC message compressed with zlib.
+
+    Large tool results are stored this way to save memory. The text is only
+    decompressed when the message is replayed, and not kept afterwards.
+    """
+
+    __slots__ = ("data",)
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    @property
+    def json(self) -> str:
+        return zlib.decompress(self.data).decode()
+
+    def model_dump_json(self, **_kwargs) -> str:
+        return self.json
+
+    def decode(self) -> JSONRPCMessage:
+        return JSONRPCMessage.model_validate_json(self.json)
+
+
+@dataclass(slots=True)
 class EventEntry:
     """
     Represents an event entry in the event store.
+
+    `seq` grows by one within a stream and `tick` grows across the whole
+    store. The event ID is not kept: it is derived from the stream's token
+    and ordinal and `seq` whenever the event is sent. `progress_token` is set
+    for progress notifications so replays can coalesce them without decoding.
+    """
+
+    ordinal: int
+    seq: int
+    tick: int
+    size: int
+    message: EncodedMessage | CompressedMessage
+    progress_token: ProgressToken | None = None
+
+
+def coalesce_progress(events: list[EventEntry]) -> list[EventEntry]:
+    """Collapse each run of progress notifications for one token to its latest event.
+
+    Progress only ever moves forward, so a client catching up needs the last
+    report of a run, not every step. Any other event ends the run and is kept.
+    """
+    return [
+        event
+        for event, next_event in zip(events, events[1:] + [None])
+        if event.progress_token is None
+        or next_event is None
+        or next_event.progress_token != event.progress_token
+    ]
+
+
+@dataclass
+class StreamBuffer:
+    """
+    The buffered events of one stream and its bookkeeping.
+    """
+
+    key: StreamKey
+    ordinal: int
+    token: str
+    events: deque[EventEntry] = field(default_factory=deque)
+    next_seq: int = 0
+    size: int = 0
+    last_active: float = 0.0
+
+
+@dataclass(slots=True)
+class ReplayCursor:
+    """
+    How far a replay has got through one stream.
+
+    The events from `next_seq` up to `last_seq` (the stream's newest event
+    when the replay started) have yet to be sent.
     """
 
-    event_id: EventId
-    stream_id: StreamId
-    message: JSONRPCMessage
+    stream: StreamBuffer
+    next_seq: int
+    last_seq: int
 
 
 class InMemoryEventStore(EventStore):
@@ -40,90 +220,372 @@ class InMemoryEventStore(EventStore):
     where a persistent storage solution would be more appropriate.
 
     This implementation keeps only the last N events per stream for memory efficiency.
+    Each event is accounted by the size of its encoded JSON, or of its zlib
+    compressed form if it was larger than `compress_threshold`. Once the store as a
+    whole exceeds `max_bytes`, events are evicted from the least recently used
+    streams first, and streams idle for longer than `stream_ttl` are dropped.
+
+    Event IDs have the form `<stream token>.<stream ordinal>.<seq>` in hex.
+    Sequence numbers within a stream are contiguous, so an event is found by
+    arithmetic on its stream's buffer without any per-event index. The token
+    is derived from the session's secret key (see `stream_token`): an ID only
+    resolves if its token matches the stream's, so clients cannot replay
+    other sessions' streams by guessing ordinals, and IDs handed out before
+    a restart match no new events.
+
+    By default a resuming client only receives the events it missed on the
+    stream that owns its `Last-Event-ID`, as the MCP specification requires.
+    With `replay_scope="session"` it also receives events written since then
+    on the other streams of the same session.
+
+    With `coalesce_progress=True` a replay sends only the latest of each run
+    of `notifications/progress` messages for the same `progressToken`; log
+    messages, results and all other events are still sent in full.
+
+    Replays are sent in windows of at most `send_window` events. Each window
+    is collected afresh from the buffers, so a slow consumer holds on to no
+    more than one window and events can still be evicted underneath it. A
+    replay that misses `replay_deadline` is cut off, and the client resumes
+    from the last event it received. If the backlog exceeds
+    `max_replay_backlog`, or events are evicted before they could be sent,
+    the client gets a "resync required" error instead of an incomplete replay.
     """
 
-    def __init__(self, max_events_per_stream: int = 100):
+    def __init__(
+        self,
+        max_events_per_stream: int = 100,
+        replay_scope: ReplayScope = "stream",
+        max_bytes: int = 64 * 1024 * 1024,
+        stream_ttl: float = 3600.0,
+        metrics: EventStoreMetrics | None = None,
+        coalesce_progress: bool = False,
+        compress_threshold: int | None = 4096,
+        compress_level: int = 1,
+        send_window: int = 64,
+        replay_deadline: float | None = 30.0,
+        max_replay_backlog: int | None = None,
+    ):
         """Initialize the event store.
 
         Args:
             max_events_per_stream: Maximum number of events to keep per stream
+            replay_scope: "stream" to replay only the resuming stream, or
+                "session" to include the session's other streams as well
+            max_bytes: Store-wide budget for the encoded size of all events
+            stream_ttl: Seconds after which an idle stream is dropped
+            metrics: Metrics to update; a new set is created if omitted
+            coalesce_progress: Replay only the latest of consecutive progress
+                notifications for the same progress token
+            compress_threshold: Encoded size in bytes above which events are
+                compressed with zlib; None disables compression
+            compress_level: zlib compression level, from 1 (fastest) to 9
+            send_window: Maximum number of events collected and sent at once
+            replay_deadline: Seconds a replay may take before it is cut off;
+                None lets a replay take as long as the client needs
+            max_replay_backlog: Number of missed events above which the client
+                is told to resync instead; None always replays
         """
         self.max_events_per_stream = max_events_per_stream
-        # for maintaining last N events per stream
-        self.streams: dict[StreamId, deque[EventEntry]] = {}
-        # event_id -> EventEntry for quick lookup
-        self.event_index: dict[EventId, EventEntry] = {}
+        self.replay_scope = replay_scope
+        self.max_bytes = max_bytes
+        self.stream_ttl = stream_ttl
+        self.coalesce_progress = coalesce_progress
+        self.compress_threshold = compress_threshold
+        self.compress_level = compress_level
+        self.send_window = send_window
+        self.replay_deadline = replay_deadline
+        self.max_replay_backlog = max_replay_backlog
+        # per-stream buffers, least recently used first
+        self.streams: OrderedDict[StreamKey, StreamBuffer] = OrderedDict()
+        # stream ordinal (as encoded in event IDs) -> buffer
+        self.ordinals: dict[int, StreamBuffer] = {}
+        # session key -> IDs of the streams that session has written to
+        self.session_streams: dict[str, set[StreamId]] = {}
+        self.total_events = 0
+        self.total_bytes = 0
+        self._ticks = count(1)
+        self._stream_ordinals = count(1)
+
+        self.metrics = metrics or EventStoreMetrics()
+        self.metrics.add_gauge("bytes_held", "Encoded bytes currently held.", lambda: self.total_bytes)
+        self.metrics.add_gauge("events_held", "Events currently held.", lambda: self.total_events)
+        self.metrics.add_gauge("streams_held", "Streams currently held.", lambda: len(self.streams))
+
+    def stats(self) -> dict[str, int]:
+        """Report how much the store currently holds."""
+        return {
+            "streams": len(self.streams),
+            "events": self.total_events,
+            "bytes": self.total_bytes,
+            "evicted_events": self.metrics.evictions,
+        }
+
+    def _event_id(self, stream: StreamBuffer, event: EventEntry) -> EventId:
+        return f"{stream.token}.{event.ordinal:x}.{event.seq:x}"
+
+    def _find_event(self, event_id: EventId) -> tuple[StreamBuffer, int] | None:
+        """Return the stream holding an event and the event's position in it."""
+        token, _, rest = event_id.partition(".")
+        ordinal, _, seq = rest.partition(".")
+        try:
+            stream = self.ordinals.get(int(ordinal, 16))
+            seq_number = int(seq, 16)
+        except ValueError:
+            return None
+        if stream is None or not token_matches(token, stream.token):
+            return None
+        position = seq_number - stream.events[0].seq
+        if not 0 <= position < len(stream.events):
+            return None
+        return stream, position
+
+    def _evict_oldest(self, stream: StreamBuffer, drop_empty: bool = True) -> None:
+        """Drop the oldest event of a stream, and the stream once it is empty."""
+        oldest_event = stream.events.popleft()
+        stream.size -= oldest_event.size
+        self.total_events -= 1
+        self.total_bytes -= oldest_event.size
+        self.metrics.record_evictions()
+        if drop_empty and not stream.events:
+            self._drop_stream(stream)
+
+    def _drop_stream(self, stream: StreamBuffer) -> None:
+        del self.streams[stream.key]
+        del self.ordinals[stream.ordinal]
+        self.total_events -= len(stream.events)
+        self.total_bytes -= stream.size
+        self.metrics.record_evictions(len(stream.events))
+
+        session_key, stream_id = stream.key
+        session = self.session_streams[session_key]
+        session.discard(stream_id)
+        if not session:
+            del self.session_streams[session_key]
+
+    def _expire_idle_streams(self, now: float) -> None:
+        # Streams are kept in LRU order, so the idle ones are at the front
+        while self.streams:
+            stream = next(iter(self.streams.values()))
+            if now - stream.last_active <= self.stream_ttl:
+                break
+            logger.debug(f"🧹 Dropping idle stream {stream.key[1]}")
+            self._drop_stream(stream)
+
+    def _enforce_byte_budget(self, keep: EventEntry) -> None:
+        # Evict from the least recently used streams, but never the event just stored
+        while self.total_bytes > self.max_bytes:
+            stream = next(iter(self.streams.values()))
+            if stream.events[0] is keep:
+                break
+            self._evict_oldest(stream)
+
+    def _encode(self, message: JSONRPCMessage) -> tuple[EncodedMessage | CompressedMessage, int]:
+        """Encode a message, compressing it if it is large; returns it with its encoded size."""
+        encoded = EncodedMessage.encode(message)
+        if self.compress_threshold is None or len(encoded.json) <= self.compress_threshold:
+            return encoded, len(encoded.json)
+
+        data = encoded.json.encode()
+        compressed = zlib.compress(data, self.compress_level)
+        self.metrics.record_compression(len(data), len(compressed))
+        if len(compressed) >= len(data):
+            # Incompressible payloads are cheaper to keep as they are
+            return encoded, len(data)
+        return CompressedMessage(compressed), len(data)
 
     async def store_event(
         self, stream_id: StreamId, message: JSONRPCMessage
     ) -> EventId:
-        """Stores an event with a generated event ID."""
-        event_id = str(uuid4())
-        event_entry = EventEntry(
-            event_id=event_id, 
-            stream_id=stream_id, 
-            message=message
-        )
+        """Stores an event and returns its sequence-encoded event ID."""
+        now = monotonic()
+        self._expire_idle_streams(now)
 
-        # Get or create deque for this stream
-        if stream_id not in self.streams:
-            self.streams[stream_id] = deque(maxlen=self.max_events_per_stream)
+        session_key = current_session_key()
+        key = (session_key, stream_id)
 
-        # If deque is full, the oldest event will be automatically removed
-        # We need to remove it from the event_index as well
-        if len(self.streams[stream_id]) == self.max_events_per_stream:
-            oldest_event = self.streams[stream_id][0]
-            self.event_index.pop(oldest_event.event_id, None)
+        # Get or create the buffer for this stream and mark it most recently used
+        stream = self.streams.get(key)
+        if stream is None:
+            stream = StreamBuffer(
+                key=key, ordinal=next(self._stream_ordinals), token=stream_token(session_key, stream_id)
+            )
+            self.streams[key] = self.ordinals[stream.ordinal] = stream
+            self.session_streams.setdefault(session_key, set()).add(stream_id)
+        else:
+            self.streams.move_to_end(key)
+        stream.last_active = now
+
+        # If the stream is full, drop its oldest event
+        if len(stream.events) == self.max_events_per_stream:
+            self._evict_oldest(stream, drop_empty=False)
+
+        # Keep only the encoded message: it is smaller than the pydantic model
+        # and is exactly what a replay has to send
+        encoded, encoded_size = self._encode(message)
+        event_entry = EventEntry(
+            ordinal=stream.ordinal,
+            seq=stream.next_seq,
+            tick=next(self._ticks),
+            size=len(encoded.data) if isinstance(encoded, CompressedMessage) else encoded_size,
+            message=encoded,
+            progress_token=progress_token(message),
+        )
+        stream.next_seq += 1
 
         # Add new event
-        self.streams[stream_id].append(event_entry)
-        self.event_index[event_id] = event_entry
+        stream.events.append(event_entry)
+        stream.size += event_entry.size
+        self.total_events += 1
+        self.total_bytes += event_entry.size
+        self.metrics.record_store(encoded_size)
+        self._enforce_byte_budget(keep=event_entry)
 
-        print(f"🏪 Stored event {event_id} in stream {stream_id}")
+        event_id = self._event_id(stream, event_entry)
+        logger.debug(f"🏪 Stored event {event_id} in stream {stream_id} ({event_entry.size} bytes)")
         return event_id
 
+    def _replay_cursors(self, stream: StreamBuffer, last_event: EventEntry) -> dict[int, ReplayCursor]:
+        """Return a cursor, keyed by stream ordinal, for each stream with events to replay."""
+        cursors = {}
+        # Everything after the last event's position in its own stream is missed
+        if last_event is not stream.events[-1]:
+            cursors[stream.ordinal] = ReplayCursor(stream, last_event.seq + 1, stream.events[-1].seq)
+
+        # The session's other streams only contribute events written after
+        # the last event, found by bisection on the store-wide tick
+        if self.replay_scope == "session":
+            session_key, _ = stream.key
+            for other_id in self.session_streams[session_key]:
+                other = self.streams[(session_key, other_id)]
+                if other is stream or other.events[-1].tick <= last_event.tick:
+                    continue
+                start = bisect_right(other.events, last_event.tick, key=attrgetter("tick"))
+                cursors[other.ordinal] = ReplayCursor(other, other.events[start].seq, other.events[-1].seq)
+        return cursors
+
+    def _next_window(self, cursors: dict[int, ReplayCursor]) -> list[EventEntry] | None:
+        """Collect up to `send_window` unsent events in tick order and advance the cursors.
+
+        Returns None if a stream has evicted events that were not sent yet.
+        """
+        window = []
+        for cursor in cursors.values():
+            if cursor.next_seq > cursor.last_seq:
+                continue
+            stream = cursor.stream
+            if self.ordinals.get(stream.ordinal) is not stream or not stream.events:
+                return None
+            start = cursor.next_seq - stream.events[0].seq
+            if start < 0:
+                return None
+            stop = start + min(self.send_window, cursor.last_seq - cursor.next_seq + 1)
+            window.extend(islice(stream.events, start, stop))
+
+        if len(cursors) > 1:
+            window.sort(key=attrgetter("tick"))
+            del window[self.send_window :]
+        for event in window:
+            cursors[event.ordinal].next_seq = event.seq + 1
+        return window
+
+    async def _abort_replay(
+        self, stream_id: StreamId, send_batch: EventBatchCallback, reason: str, detail: str
+    ) -> None:
+        logger.warning(f"⛔ Replay of stream {stream_id} needs a resync: {detail}")
+        self.metrics.record_replay_abort(reason)
+        # The standalone GET stream has no request the client could re-issue
+        if stream_id != GET_STREAM_KEY:
+            await send_batch([EventMessage(resync_required(stream_id, detail))])
+
     async def replay_events_after(
         self,
         last_event_id: EventId,
         send_callback: EventCallback,
     ) -> StreamId | None:
-        """Replays events that occurred after the specified event ID across ALL streams."""
-        print(f"🔄 Replaying events after {last_event_id}")
-        if last_event_id not in self.event_index:
+        """Replays events written after the specified event ID within the replay scope."""
+
+        async def send_batch(batch: list[EventMessage]) -> None:
+            for event_message in batch:
+                await send_callback(event_message)
+
+        return await self.replay_batches_after(last_event_id, send_batch)
+
+    async def replay_batches_after(
+        self,
+        last_event_id: EventId,
+        send_batch: EventBatchCallback,
+    ) -> StreamId | None:
+        """Replays missed events in batches of at most `send_window` events.
+
+        The SDK transport takes one event per callback and goes through
+        `replay_events_after`; transports that can write several SSE events
+        at once can call this directly and skip the per-event awaits.
+
+        Returns the stream ID to keep streaming, or None if the event ID is
+        unknown or the replay was aborted.
+        """
+        logger.info(f"🔄 Replaying events after {last_event_id}")
+        started = perf_counter()
+        # Idle streams also expire on a server that only replays, and an
+        # expired stream must not be resumed
+        self._expire_idle_streams(monotonic())
+        found = self._find_event(last_event_id)
+        if found is None:
             logger.warning(f"Event ID {last_event_id} not found in store")
+            self.metrics.record_replay(None, perf_counter() - started)
             return None
 
-        # Get the last known event
-        last_event = self.event_index[last_event_id]
-        print(f"🔄 Last event stream: {last_event.stream_id}")
-
-        # Search across ALL streams for events that came after the last event
-        events_to_replay = []
-        
-        for stream_id, stream_events in self.streams.items():
-            print(f"🔄 Checking stream {stream_id} with {len(stream_events)} events")
-            
-            # If this is the same stream as the last event, find events after it
-            if stream_id == last_event.stream_id:
-                found_last = False
-                for event in stream_events:
-                    if found_last:
-                        events_to_replay.append(event)
-                        print(f"🔄 Found event to replay: {event.event_id} in same stream {stream_id}")
-                    elif event.event_id == last_event_id:
-                        found_last = True
-            else:
-                # Different stream - include ALL events (they all came after initialization)
-                for event in stream_events:
-                    events_to_replay.append(event)
-                    print(f"🔄 Found event to replay: {event.event_id} in different stream {stream_id}")
-
-        print(f"🔄 Found {len(events_to_replay)} events to replay")
-
-        # Send all events
-        for event in events_to_replay:
-            print(f"🔄 Sending event: {event.event_id} from stream {event.stream_id}")
-            await send_callback(EventMessage(event.message, event.event_id))
-
-        # Return the original stream ID for compatibility
-        return last_event.stream_id
+        # Mark the stream as recently used so it is evicted last
+        stream, position = found
+        self.streams.move_to_end(stream.key)
+        stream.last_active = monotonic()
+        cursors = self._replay_cursors(stream, stream.events[position])
+        backlog = sum(cursor.last_seq - cursor.next_seq + 1 for cursor in cursors.values())
+
+        _, stream_id = stream.key
+        logger.info(
+            f"🔄 Found {backlog} events to replay "
+            f"(last event stream: {stream_id}, scope: {self.replay_scope})"
+        )
+        if self.max_replay_backlog is not None and backlog > self.max_replay_backlog:
+            await self._abort_replay(
+                stream_id, send_batch, "backlog", f"{backlog} missed events exceed the limit of {self.max_replay_backlog}"
+            )
+            return None
+
+        # Send window by window, collecting each one only once the previous
+        # has been delivered. EncodedMessage stands in for JSONRPCMessage
+        # here (see its docstring), and CompressedMessage decompresses only
+        # as each event is sent.
+        sent = 0
+        try:
+            async with asyncio.timeout(self.replay_deadline):
+                while window := self._next_window(cursors):
+                    if self.coalesce_progress:
+                        window = coalesce_progress(window)
+                    batch = [
+                        EventMessage(event.message, self._event_id(cursors[event.ordinal].stream, event))
+                        for event in window
+                    ]
+                    logger.debug(f"🔄 Sending {len(batch)} events up to {batch[-1].event_id}")
+                    await send_batch(batch)
+                    sent += len(batch)
+        except TimeoutError:
+            logger.warning(
+                f"⏱️ Replay of stream {stream_id} missed its {self.replay_deadline}s deadline "
+                f"before all {backlog} events were sent; the client can resume from the last one it got"
+            )
+            self.metrics.record_replay_abort("deadline")
+            return None
+
+        if window is None:
+            await self._abort_replay(
+                stream_id, send_batch, "evicted", f"events were evicted after {sent} of {backlog} were sent"
+            )
+            return None
+
+        logger.info(f"🔄 Sent {sent} of {backlog} events")
+        self.metrics.record_replay(sent, perf_counter() - started)
+
+        # Return the original stream ID so the transport keeps streaming it
+        return stream_id
@@ -0,0 +1,200 @@
+"""
+Counters and histograms for the resumption event stores.
+
+`EventStoreMetrics` is updated by the stores as they work and can be read
+from Python with `snapshot()` or scraped in the Prometheus text format with
+`render_prometheus()`.
+"""
+
+from bisect import bisect_left
+from collections.abc import Callable
+from time import monotonic
+
+PREFIX = "mcp_event_store"
+
+
+class Histogram:
+    """
+    A cumulative histogram with fixed upper bounds, as Prometheus expects.
+    """
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def render(self, name: str) -> list[str]:
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, self.counts):
+            cumulative += bucket_count
+            lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum {self.sum}")
+        lines.append(f"{name}_count {self.count}")
+        return lines
+
+
+class EventStoreMetrics:
+    """
+    Metrics shared by every EventStore implementation in this example.
+
+    Gauges such as the bytes held are read from the store on demand through
+    the callables registered with `add_gauge`.
+    """
+
+    def __init__(self):
+        self.events_stored = 0
+        self.bytes_stored = 0
+        self.evictions = 0
+        self.replay_requests = 0
+        self.replay_misses = 0
+        # reason ("backlog", "evicted" or "deadline") -> replays cut short
+        self.replay_aborts: dict[str, int] = {}
+        self.events_compressed = 0
+        self.compression_input_bytes = 0
+        self.compression_output_bytes = 0
+        self.events_per_replay = Histogram((0, 1, 5, 10, 50, 100, 500, 1000))
+        self.replay_latency = Histogram((0.0001, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5))
+        self.gauges: dict[str, tuple[str, Callable[[], float]]] = {}
+        # events stored in the current and the previous one-second window
+        self._window_start = monotonic()
+        self._window_events = 0
+        self._previous_window_events = 0
+
+    def add_gauge(self, name: str, help_text: str, read: Callable[[], float]) -> None:
+        self.gauges[name] = (help_text, read)
+
+    def record_store(self, size: int) -> None:
+        now = monotonic()
+        if now - self._window_start >= 1.0:
+            # an idle gap longer than a window means the previous one was empty
+            self._previous_window_events = (
+                self._window_events if now - self._window_start < 2.0 else 0
+            )
+            self._window_events = 0
+            self._window_start = now
+        self._window_events += 1
+        self.events_stored += 1
+        self.bytes_stored += size
+
+    def record_compression(self, raw_size: int, compressed_size: int) -> None:
+        self.events_compressed += 1
+        self.compression_input_bytes += raw_size
+        self.compression_output_bytes += compressed_size
+
+    @property
+    def compression_ratio(self) -> float:
+        """Encoded bytes per compressed byte over all compressed events (1.0 if none)."""
+        if not self.compression_output_bytes:
+            return 1.0
+        return self.compression_input_bytes / self.compression_output_bytes
+
+    def record_evictions(self, count: int = 1) -> None:
+        self.evictions += count
+
+    def record_replay(self, events: int | None, seconds: float) -> None:
+        """Record one replay request; `events` is None if its event ID was unknown."""
+        self.replay_requests += 1
+        if events is None:
+            self.replay_misses += 1
+            return
+        self.events_per_replay.observe(events)
+        self.replay_latency.observe(seconds)
+
+    def record_replay_abort(self, reason: str) -> None:
+        """Record a replay request that was cut short or answered with a resync."""
+        self.replay_requests += 1
+        self.replay_aborts[reason] = self.replay_aborts.get(reason, 0) + 1
+
+    def events_stored_per_second(self) -> float:
+        """Store rate over the last complete one-second window."""
+        elapsed = monotonic() - self._window_start
+        if elapsed >= 2.0:
+            return 0.0
+        if elapsed >= 1.0:
+            return float(self._window_events)
+        return float(self._previous_window_events)
+
+    def snapshot(self) -> dict[str, float]:
+        snapshot = {
+            "events_stored": self.events_stored,
+            "events_stored_per_second": self.events_stored_per_second(),
+            "bytes_stored": self.bytes_stored,
+            "evictions": self.evictions,
+            "replay_requests": self.replay_requests,
+            "replay_misses": self.replay_misses,
+            "replay_aborts": sum(self.replay_aborts.values()),
+            "events_compressed": self.events_compressed,
+            "compression_ratio": self.compression_ratio,
+            "events_per_replay_mean": self.events_per_replay.mean,
+            "replay_latency_mean_seconds": self.replay_latency.mean,
+        }
+        for name, (_, read) in self.gauges.items():
+            snapshot[name] = read()
+        return snapshot
+
+    def render_prometheus(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        lines = []
+
+        def metric(name: str, kind: str, help_text: str, values: list[str]) -> None:
+            lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+            lines.extend(values)
+
+        for name, help_text, value in (
+            ("events_stored_total", "Events written to the store.", self.events_stored),
+            ("bytes_stored_total", "Encoded bytes written to the store.", self.bytes_stored),
+            ("evictions_total", "Events evicted by the per-stream cap, byte budget or TTL.", self.evictions),
+            ("replay_requests_total", "Replay requests (reconnects with Last-Event-ID).", self.replay_requests),
+            ("replay_misses_total", "Replay requests whose event ID was unknown.", self.replay_misses),
+            ("events_compressed_total", "Events large enough to be compressed.", self.events_compressed),
+            ("compression_input_bytes_total", "Encoded bytes of compressed events.", self.compression_input_bytes),
+            ("compression_output_bytes_total", "Compressed bytes of compressed events.", self.compression_output_bytes),
+        ):
+            metric(name, "counter", help_text, [f"{PREFIX}_{name} {value}"])
+
+        metric(
+            "compression_ratio",
+            "gauge",
+            "Encoded bytes per compressed byte over all compressed events.",
+            [f"{PREFIX}_compression_ratio {self.compression_ratio}"],
+        )
+
+        metric(
+            "replay_aborts_total",
+            "counter",
+            "Replay requests cut short or answered with a resync, by reason.",
+            [
+                f'{PREFIX}_replay_aborts_total{{reason="{reason}"}} {value}'
+                for reason, value in sorted(self.replay_aborts.items())
+            ],
+        )
+
+        for name, (help_text, read) in self.gauges.items():
+            metric(name, "gauge", help_text, [f"{PREFIX}_{name} {read()}"])
+
+        metric(
+            "replay_events",
+            "histogram",
+            "Events sent per replay.",
+            self.events_per_replay.render(f"{PREFIX}_replay_events"),
+        )
+        metric(
+            "replay_latency_seconds",
+            "histogram",
+            "Time to send all events of a replay.",
+            self.replay_latency.render(f"{PREFIX}_replay_latency_seconds"),
+        )
+        return "\n".join(lines) + "\n"
@@ -6,13 +6,21 @@ from datetime import datetime
 
 from mcp.server.fastmcp import FastMCP
 from memory_store import InMemoryEventStore
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(message)s')
 logger = logging.getLogger(__name__)
 
-# Create event store for resumption
-event_store = InMemoryEventStore()
+# Create event store for resumption. Session scope lets a client that only
+# holds the initialize event ID still receive the tool result, which the
+# server writes to the tool call's own stream.
+event_store = InMemoryEventStore(replay_scope="session")
+
+# To keep buffered events across server restarts, use the disk-backed store:
+#   from file_store import SegmentFileEventStore
+#   event_store = SegmentFileEventStore(".event_store", replay_scope="session")
 
 # Initialize FastMCP server with EventStore
 mcp = FastMCP(
@@ -49,6 +57,14 @@ async def get_forecast(city: str) -> str:
     return json.dumps(result)
 
 
+@mcp.custom_route("/metrics", methods=["GET"])
+async def metrics(request: Request) -> PlainTextResponse:
+    """Expose the event store metrics for Prometheus to scrape."""
+    return PlainTextResponse(
+        event_store.metrics.render_prometheus(),
+        media_type="text/plain; version=0.0.4",
+    )
+
 
 # Create the ASGI app
 mcp_app = mcp.streamable_http_app()
@@ -0,0 +1,279 @@
+"""
+Shared-memory ring-buffer event store for resumability across workers.
+
+Every uvicorn worker on the host attaches to the same named shared memory
+block, which holds a fixed-size index ring and a byte ring for event data.
+Any worker can therefore look up a `Last-Event-ID` written by another one.
+Writers serialize on an `flock` lock file; the oldest events are simply
+overwritten once either ring wraps around. Each index entry links to the
+next event of its stream and of its session, so a replay follows one chain
+and never scans the events of other streams or workers.
+"""
+
+import fcntl
+import logging
+import struct
+import tempfile
+import time
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from pathlib import Path
+from secrets import randbits
+
+from mcp.server.streamable_http import (
+    EventCallback,
+    EventId,
+    EventMessage,
+    EventStore,
+    StreamId,
+)
+from mcp.types import JSONRPCMessage
+
+from memory_store import EncodedMessage, ReplayScope, StreamKey, current_session_key, stream_token, token_matches
+from metrics import EventStoreMetrics
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"MCPRING2"
+# magic, epoch, index slots, data ring size, next global sequence, data bytes written
+HEADER = struct.Struct("<8sQQQQQ")
+# global sequence, next event of the stream, next event of the session, data
+# offset, payload length, session key length, stream ID length; a next
+# sequence of 0 means none, as no event can follow event 0
+ENTRY = struct.Struct("<QQQQIHH")
+# byte offsets of the two links within an entry
+NEXT_IN_STREAM = 8
+NEXT_IN_SESSION = 16
+
+
+class SharedMemoryEventStore(EventStore):
+    """
+    EventStore backed by `multiprocessing.shared_memory` ring buffers.
+
+    Each event gets a host-wide sequence number; its event ID is
+    `<stream token>-<epoch>-<sequence>` in hex, where the epoch is chosen
+    when the shared block is created and the token is derived from the
+    session's secret key (see `stream_token`). Entry `n % index_slots` of the
+    index ring describes the event with sequence number `n`, and each entry
+    points at the event's session key, stream ID and encoded message in the
+    data ring.
+
+    A session's messages are all written from one worker, so that worker
+    remembers the last event of each of its streams and sessions and links
+    the new event from it. A replay copies the events along the stream's (or
+    in session scope, the session's) chain under a shared lock: the time it
+    holds the lock grows with the events it replays, not with everything the
+    workers have written since.
+    """
+
+    def __init__(
+        self,
+        name: str = "mcp_event_store",
+        index_slots: int = 65536,
+        data_size: int = 64 * 1024 * 1024,
+        replay_scope: ReplayScope = "stream",
+        metrics: EventStoreMetrics | None = None,
+    ):
+        """Create the shared block, or attach to it if another worker already has.
+
+        Args:
+            name: Name of the shared memory block, the same in every worker
+            index_slots: Number of events the index ring can describe
+            data_size: Size of the byte ring holding event data
+            replay_scope: "stream" to replay only the resuming stream, or
+                "session" to include the session's other streams as well
+            metrics: Metrics to update; a new set is created if omitted
+        """
+        self.replay_scope = replay_scope
+        self.metrics = metrics or EventStoreMetrics()
+        # sequence numbers of the last event this worker wrote to each stream and session
+        self._last_in_stream: dict[StreamKey, int] = {}
+        self._last_in_session: dict[str, int] = {}
+        self._lock_file = open(Path(tempfile.gettempdir()) / f"{name}.lock", "a+b")
+
+        size = HEADER.size + index_slots * ENTRY.size + data_size
+        with self._locked(fcntl.LOCK_EX):
+            try:
+                self.shm = shared_memory.SharedMemory(name=name, create=True, size=size, track=False)
+                HEADER.pack_into(self.shm.buf, 0, MAGIC, randbits(32), index_slots, data_size, 0, 0)
+            except FileExistsError:
+                self.shm = shared_memory.SharedMemory(name=name, track=False)
+
+        magic, self.epoch, self.index_slots, self.data_size, _, _ = HEADER.unpack_from(self.shm.buf, 0)
+        if magic != MAGIC:
+            raise ValueError(f"Shared memory block {name!r} is not an event store")
+        self._data_start = HEADER.size + self.index_slots * ENTRY.size
+        self.metrics.add_gauge(
+            "bytes_held",
+            "Bytes held in the shared data ring.",
+            lambda: min(self._read_header()[1], self.data_size),
+        )
+
+    @contextmanager
+    def _locked(self, operation: int):
+        fcntl.flock(self._lock_file, operation)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _read_header(self) -> tuple[int, int]:
+        """Return the next global sequence number and the data bytes written."""
+        *_, head, written = HEADER.unpack_from(self.shm.buf, 0)
+        return head, written
+
+    def _entry_offset(self, gseq: int) -> int:
+        return HEADER.size + (gseq % self.index_slots) * ENTRY.size
+
+    def _write_data(self, logical_offset: int, data: bytes) -> None:
+        start = logical_offset % self.data_size
+        first = min(len(data), self.data_size - start)
+        buf = self.shm.buf
+        buf[self._data_start + start : self._data_start + start + first] = data[:first]
+        if first < len(data):
+            buf[self._data_start : self._data_start + len(data) - first] = data[first:]
+
+    def _read_data(self, logical_offset: int, length: int) -> bytes:
+        start = logical_offset % self.data_size
+        first = min(length, self.data_size - start)
+        buf = self.shm.buf
+        data = bytes(buf[self._data_start + start : self._data_start + start + first])
+        if first < length:
+            data += bytes(buf[self._data_start : self._data_start + length - first])
+        return data
+
+    def _link(self, last: dict, key: str | StreamKey, link: int, gseq: int, head: int, written: int) -> None:
+        """Point the entry of the last event under `key` at `gseq`, and remember `gseq` as the last."""
+        previous = last.get(key)
+        if previous is not None and self._entry(previous, head, written) is not None:
+            struct.pack_into("<Q", self.shm.buf, self._entry_offset(previous) + link, gseq)
+        last[key] = gseq
+
+    def _forget_overwritten(self, head: int) -> None:
+        """Drop links to events that have left the index ring."""
+        oldest = head - self.index_slots
+        for last in (self._last_in_stream, self._last_in_session):
+            # At most index_slots of the links are live, so this runs rarely
+            if len(last) > 2 * self.index_slots:
+                for key in [key for key, gseq in last.items() if gseq < oldest]:
+                    del last[key]
+
+    def _entry(self, gseq: int, head: int, written: int) -> tuple[int, int, int, int, int, int] | None:
+        """Return a live index entry (minus its sequence number), or None if overwritten."""
+        if not max(0, head - self.index_slots) <= gseq < head:
+            return None
+        stored_gseq, *entry = ENTRY.unpack_from(self.shm.buf, self._entry_offset(gseq))
+        data_offset = entry[2]
+        if stored_gseq != gseq or data_offset < written - self.data_size:
+            return None
+        return tuple(entry)
+
+    async def store_event(
+        self, stream_id: StreamId, message: JSONRPCMessage
+    ) -> EventId:
+        """Appends an event to the shared rings and returns its event ID."""
+        session_key = current_session_key()
+        session_bytes = session_key.encode()
+        stream_bytes = stream_id.encode()
+        payload = EncodedMessage.encode(message).json.encode()
+        record = session_bytes + stream_bytes + payload
+
+        with self._locked(fcntl.LOCK_EX):
+            head, written = self._read_header()
+            if len(record) <= self.data_size:
+                self._write_data(written, record)
+                ENTRY.pack_into(
+                    self.shm.buf,
+                    self._entry_offset(head),
+                    head,
+                    0,
+                    0,
+                    written,
+                    len(payload),
+                    len(session_bytes),
+                    len(stream_bytes),
+                )
+                written += len(record)
+                self._link(self._last_in_stream, (session_key, stream_id), NEXT_IN_STREAM, head, head + 1, written)
+                self._link(self._last_in_session, session_key, NEXT_IN_SESSION, head, head + 1, written)
+                self._forget_overwritten(head + 1)
+            else:
+                logger.warning(
+                    f"Event of {len(record)} bytes does not fit the data ring; it cannot be replayed"
+                )
+            struct.pack_into("<QQ", self.shm.buf, HEADER.size - 16, head + 1, written)
+
+        self.metrics.record_store(len(payload))
+        event_id = f"{stream_token(session_key, stream_id)}-{self.epoch:x}-{head:x}"
+        logger.debug(f"🏪 Stored event {event_id} in stream {stream_id}")
+        return event_id
+
+    async def replay_events_after(
+        self,
+        last_event_id: EventId,
+        send_callback: EventCallback,
+    ) -> StreamId | None:
+        """Replays events written after the specified event ID within the replay scope."""
+        logger.info(f"🔄 Replaying events after {last_event_id}")
+        started = time.perf_counter()
+        token, _, rest = last_event_id.partition("-")
+        epoch, _, gseq = rest.partition("-")
+        try:
+            last_gseq = int(gseq, 16) if int(epoch, 16) == self.epoch else -1
+        except ValueError:
+            last_gseq = -1
+
+        # Copy the events along the chain out under a shared lock, then send them
+        replay: list[tuple[str, int, bytes]] = []
+        stream_id = None
+        with self._locked(fcntl.LOCK_SH):
+            head, written = self._read_header()
+            last_entry = self._entry(last_gseq, head, written)
+            if last_entry is not None:
+                *_, data_offset, _, session_len, stream_len = last_entry
+                key_bytes = self._read_data(data_offset, session_len + stream_len)
+                session_key = key_bytes[:session_len].decode()
+                stream_id = key_bytes[session_len:].decode()
+                if not token_matches(token, stream_token(session_key, stream_id)):
+                    last_entry = None
+
+            if last_entry is not None:
+                # Follow the next-in-stream or the next-in-session links
+                link = 0 if self.replay_scope == "stream" else 1
+                tokens = {stream_id: token}
+                entry = last_entry
+                while (gseq := entry[link]) and (entry := self._entry(gseq, head, written)):
+                    _, _, offset, length, entry_session_len, entry_stream_len = entry
+                    record = self._read_data(offset, entry_session_len + entry_stream_len + length)
+                    payload_start = entry_session_len + entry_stream_len
+                    entry_stream_id = record[entry_session_len:payload_start].decode()
+                    if entry_stream_id not in tokens:
+                        tokens[entry_stream_id] = stream_token(session_key, entry_stream_id)
+                    replay.append((tokens[entry_stream_id], gseq, record[payload_start:]))
+
+        if last_entry is None:
+            logger.warning(f"Event ID {last_event_id} not found in store")
+            self.metrics.record_replay(None, time.perf_counter() - started)
+            return None
+
+        logger.info(
+            f"🔄 Found {len(replay)} events to replay "
+            f"(last event stream: {stream_id}, scope: {self.replay_scope})"
+        )
+
+        for event_token, gseq, payload in replay:
+            await send_callback(
+                EventMessage(EncodedMessage(payload.decode()), f"{event_token}-{self.epoch:x}-{gseq:x}")
+            )
+        self.metrics.record_replay(len(replay), time.perf_counter() - started)
+
+        return stream_id
+
+    def close(self) -> None:
+        """Detach this worker from the shared block."""
+        self.shm.close()
+        self._lock_file.close()
+
+    def unlink(self) -> None:
+        """Destroy the shared block; call once, after every worker has closed it."""
+        self.shm.unlink()
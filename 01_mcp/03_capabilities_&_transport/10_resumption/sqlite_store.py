@@ -0,0 +1,280 @@
+"""
+SQLite event store for resumability shared by several server processes.
+
+The database runs in WAL mode so that readers in one uvicorn worker never
+block the writer in another. Writes from `store_event` are buffered and
+committed together every few milliseconds, trading a small durability
+window for far fewer fsyncs. Every query runs on one worker thread, so a
+writer waiting for another process's lock never stalls the event loop.
+"""
+
+import asyncio
+import logging
+import sqlite3
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+from pathlib import Path
+
+from mcp.server.streamable_http import (
+    EventCallback,
+    EventId,
+    EventMessage,
+    EventStore,
+    StreamId,
+)
+from mcp.types import JSONRPCMessage
+
+from memory_store import EncodedMessage, ReplayScope, StreamKey, current_session_key, stream_token, token_matches
+from metrics import EventStoreMetrics
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait before retrying a batch whose commit failed
+RETRY_INTERVAL = 1.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    session_key TEXT NOT NULL,
+    tick INTEGER NOT NULL,
+    stream_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    created REAL NOT NULL,
+    message TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS events_by_id ON events (session_key, tick);
+CREATE INDEX IF NOT EXISTS events_by_stream ON events (session_key, stream_id, seq);
+CREATE INDEX IF NOT EXISTS events_by_tick ON events (tick);
+"""
+
+
+class SQLiteEventStore(EventStore):
+    """
+    SQLite implementation of the EventStore interface.
+
+    Each session's events are written by the one process that owns the
+    session, so per-stream sequence numbers and the store-wide tick can be
+    handed out locally. Event IDs have the form `<stream token>-<tick>`,
+    like those of the other stores: the session key never leaves the
+    server, and an ID only resolves if its token matches the stream of the
+    event with that tick.
+
+    The connection is only used from a single worker thread. Commits and
+    queries queue up on it in order, so a replay always sees every batch
+    whose commit started before it.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        commit_interval: float = 0.005,
+        retention_seconds: float = 3600.0,
+        replay_scope: ReplayScope = "stream",
+        metrics: EventStoreMetrics | None = None,
+    ):
+        """Initialize the event store.
+
+        Args:
+            path: SQLite database file, shared by every worker on the host
+            commit_interval: Seconds to buffer writes before committing them together
+            retention_seconds: How long events are kept before being purged
+            replay_scope: "stream" to replay only the resuming stream, or
+                "session" to include the session's other streams as well
+            metrics: Metrics to update; a new set is created if omitted
+        """
+        self.commit_interval = commit_interval
+        self.retention_seconds = retention_seconds
+        self.replay_scope = replay_scope
+        self.metrics = metrics or EventStoreMetrics()
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-event-store")
+        # Opened here, but only used from the executor's thread (and by close)
+        self.db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("PRAGMA busy_timeout=5000")
+        self.db.executescript(SCHEMA)
+
+        # next sequence number to hand out for each stream of this process,
+        # least recently written first, and when each stream was last written
+        self.next_seq: OrderedDict[StreamKey, int] = OrderedDict()
+        self.last_write: dict[StreamKey, float] = {}
+        self._ticks = count(1)
+        self._pending: list[tuple[str, int, StreamId, int, float, str]] = []
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self._flush_task: asyncio.Future | None = None
+        self._last_purge = time.time()
+
+    async def store_event(
+        self, stream_id: StreamId, message: JSONRPCMessage
+    ) -> EventId:
+        """Buffers an event for the next batched commit and returns its event ID."""
+        session_key = current_session_key()
+        key = (session_key, stream_id)
+        seq = self.next_seq.get(key, 0)
+        self.next_seq[key] = seq + 1
+        self.next_seq.move_to_end(key)
+        now = self.last_write[key] = time.time()
+        tick = next(self._ticks)
+
+        encoded = EncodedMessage.encode(message)
+        self._pending.append((session_key, tick, stream_id, seq, now, encoded.json))
+        self.metrics.record_store(len(encoded.json))
+        self._schedule_flush(self.commit_interval)
+
+        event_id = f"{stream_token(session_key, stream_id)}-{tick}"
+        logger.debug(f"🏪 Stored event {event_id} in stream {stream_id}")
+        return event_id
+
+    def _schedule_flush(self, delay: float) -> None:
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(
+                delay, self._start_flush
+            )
+
+    def _start_flush(self) -> None:
+        # Keep a reference so the task is not garbage collected mid-commit
+        self._flush_task = asyncio.ensure_future(self.flush())
+
+    async def _run(self, function: Callable, *args):
+        """Run a database call on the store's worker thread."""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    async def flush(self) -> None:
+        """Commit all buffered events in a single transaction."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._pending:
+            return
+
+        pending, self._pending = self._pending, []
+        now = time.time()
+        purge_before = None
+        if now - self._last_purge > self.retention_seconds / 10:
+            purge_before = now - self.retention_seconds
+        try:
+            purged = await self._run(self._commit, pending, purge_before)
+        except sqlite3.OperationalError:
+            # A lock or I/O failure: put the batch back ahead of newer events and try again later
+            logger.exception(f"Failed to commit {len(pending)} events; retrying in {RETRY_INTERVAL}s")
+            self._pending[:0] = pending
+            self._schedule_flush(RETRY_INTERVAL)
+            return
+        except sqlite3.Error:
+            # Anything else, such as a constraint violation, fails again on every retry
+            logger.exception(f"Dropping {len(pending)} events that cannot be committed")
+            return
+
+        if purge_before is not None:
+            self._last_purge = now
+            self.metrics.record_evictions(purged)
+            self._forget_idle_streams(purge_before)
+
+    def _commit(self, pending: list[tuple[str, int, StreamId, int, float, str]], purge_before: float | None) -> int:
+        """Insert a batch of events, and purge expired ones if a cutoff is given."""
+        with self.db:
+            self.db.execute("BEGIN IMMEDIATE")
+            self.db.executemany("INSERT INTO events VALUES (?, ?, ?, ?, ?, ?)", pending)
+            return self._purge(purge_before) if purge_before is not None else 0
+
+    def _purge(self, cutoff: float) -> int:
+        # Rows are inserted in time order, so the expired ones form a rowid prefix
+        purged = self.db.execute(
+            """
+            DELETE FROM events WHERE rowid < coalesce(
+                (SELECT rowid FROM events WHERE created >= ? ORDER BY rowid LIMIT 1),
+                (SELECT max(rowid) + 1 FROM events)
+            )
+            """,
+            (cutoff,),
+        )
+        return purged.rowcount
+
+    def _forget_idle_streams(self, cutoff: float) -> None:
+        """Drop the sequence counters of streams whose events have all been purged."""
+        while self.next_seq:
+            key = next(iter(self.next_seq))
+            if self.last_write[key] >= cutoff:
+                break
+            del self.next_seq[key], self.last_write[key]
+
+    async def replay_events_after(
+        self,
+        last_event_id: EventId,
+        send_callback: EventCallback,
+    ) -> StreamId | None:
+        """Replays events written after the specified event ID within the replay scope."""
+        logger.info(f"🔄 Replaying events after {last_event_id}")
+        started = time.perf_counter()
+        # Make this process's buffered events visible to the query below
+        await self.flush()
+
+        token, _, tick = last_event_id.rpartition("-")
+        last_event = None
+        if tick.isdigit():
+            # Ticks are handed out per process, so several events can share one;
+            # the token picks the one that belongs to the client's stream
+            for session_key, stream_id, seq in await self._run(self._find_events, int(tick)):
+                if token_matches(token, stream_token(session_key, stream_id)):
+                    last_event = session_key, stream_id, seq
+                    break
+        if last_event is None:
+            logger.warning(f"Event ID {last_event_id} not found in store")
+            self.metrics.record_replay(None, time.perf_counter() - started)
+            return None
+
+        session_key, stream_id, seq = last_event
+        rows = await self._run(self._events_after, session_key, int(tick), stream_id, seq)
+
+        logger.info(
+            f"🔄 Found {len(rows)} events to replay "
+            f"(last event stream: {stream_id}, scope: {self.replay_scope})"
+        )
+
+        tokens = {stream_id: token}
+        for event_tick, event_stream_id, message in rows:
+            if event_stream_id not in tokens:
+                tokens[event_stream_id] = stream_token(session_key, event_stream_id)
+            await send_callback(EventMessage(EncodedMessage(message), f"{tokens[event_stream_id]}-{event_tick}"))
+        self.metrics.record_replay(len(rows), time.perf_counter() - started)
+
+        return stream_id
+
+    def _find_events(self, tick: int) -> list[tuple[str, StreamId, int]]:
+        """Return (session key, stream ID, seq) of every event with a tick."""
+        return self.db.execute(
+            "SELECT session_key, stream_id, seq FROM events WHERE tick = ?",
+            (tick,),
+        ).fetchall()
+
+    def _events_after(
+        self, session_key: str, tick: int, stream_id: StreamId, seq: int
+    ) -> list[tuple[int, StreamId, str]]:
+        """Return (tick, stream ID, message) of the events to replay after an event, in order."""
+        if self.replay_scope == "session":
+            return self.db.execute(
+                "SELECT tick, stream_id, message FROM events WHERE session_key = ? AND tick > ? ORDER BY tick",
+                (session_key, tick),
+            ).fetchall()
+        return self.db.execute(
+            """
+            SELECT tick, stream_id, message FROM events
+            WHERE session_key = ? AND stream_id = ? AND seq > ? ORDER BY seq
+            """,
+            (session_key, stream_id, seq),
+        ).fetchall()
+
+    def close(self) -> None:
+        """Commit buffered events and close the database."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        # Let queued commits finish, then commit what is left from this thread
+        self._executor.shutdown()
+        if self._pending:
+            self._commit(self._pending, None)
+            self._pending = []
+        self.db.close()
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The stores are top-level modules of the example, not an installed package
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
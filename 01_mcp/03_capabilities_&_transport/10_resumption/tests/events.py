@@ -0,0 +1,41 @@
+"""Helpers shared by the event store tests."""
+
+import asyncio
+
+from mcp.server.streamable_http import EventMessage
+from mcp.types import JSONRPCMessage, JSONRPCNotification
+
+
+def notification(number: int) -> JSONRPCMessage:
+    return JSONRPCMessage(
+        JSONRPCNotification(jsonrpc="2.0", method="notifications/message", params={"data": number})
+    )
+
+
+def progress(token: str, number: int) -> JSONRPCMessage:
+    return JSONRPCMessage(
+        JSONRPCNotification(
+            jsonrpc="2.0", method="notifications/progress", params={"progressToken": token, "progress": number}
+        )
+    )
+
+
+async def store_in_new_session(store, stream_id: str, numbers: range) -> list[str]:
+    """Store events from a task of their own, as a session's message router does."""
+    return await store_messages_in_new_session(store, stream_id, [notification(number) for number in numbers])
+
+
+async def store_messages_in_new_session(store, stream_id: str, messages: list[JSONRPCMessage]) -> list[str]:
+    async def write() -> list[str]:
+        return [await store.store_event(stream_id, message) for message in messages]
+
+    return await asyncio.create_task(write())
+
+
+async def replay(store, last_event_id: str) -> tuple[str | None, list[EventMessage]]:
+    sent: list[EventMessage] = []
+
+    async def send(event: EventMessage) -> None:
+        sent.append(event)
+
+    return await store.replay_events_after(last_event_id, send), sent
@@ -0,0 +1,79 @@
+import asyncio
+import json
+
+import httpx
+
+from client import SimpleMCPClient, SSEParser
+
+
+def test_parser_keeps_unicode_line_separators_inside_data():
+    payload = json.dumps({"text": "one\u2028two\u2029three\x85four\x0bfive\x0csix"}, ensure_ascii=False)
+    body = f"id: 7\r\nevent: message\r\ndata: {payload}\r\n\r\n"
+
+    # Split inside the first CRLF, and feed the rest one character at a time
+    parser = SSEParser()
+    split = body.index("\r\n") + 1
+    events = parser.feed(body[:split])
+    for character in body[split:]:
+        events += parser.feed(character)
+    events += parser.close()
+
+    assert len(events) == 1
+    assert events[0].id == "7"
+    assert json.loads(events[0].data) == json.loads(payload)
+
+
+def test_parser_treats_crlf_split_across_chunks_as_one_line_break():
+    parser = SSEParser()
+    events = parser.feed("data: first\r")
+    events += parser.feed("\ndata: second\r")
+    events += parser.feed("\n\r")
+    events += parser.feed("\n")
+
+    assert [(event.event, event.data) for event in events] == [("message", "first\nsecond")]
+
+
+def test_parser_accepts_lone_cr_and_lf_line_breaks():
+    parser = SSEParser()
+    events = parser.feed("data: a\rdata: b\n\rdata: c\n\n")
+
+    assert [event.data for event in events] == ["a\nb", "c"]
+
+
+def resume_against(responses: list[httpx.Response]) -> tuple[str | None, int]:
+    """Resume against a server answering each GET with the next response."""
+    requests = []
+
+    def handle(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return responses[len(requests) - 1]
+
+    async def main():
+        client = SimpleMCPClient()
+        client.client = httpx.AsyncClient(transport=httpx.MockTransport(handle))
+        client.last_event_id = "0"
+        try:
+            return await client.resume_and_retry("slow", {}, base_delay=0.001)
+        finally:
+            await client.cleanup()
+
+    return asyncio.run(main()), len(requests)
+
+
+def test_resume_backs_off_on_server_errors_and_stops_on_client_errors():
+    result = {"jsonrpc": "2.0", "id": 2, "result": {"content": []}}
+    sse = httpx.Response(
+        200, headers={"content-type": "text/event-stream"}, text=f"id: 1\ndata: {json.dumps(result)}\n\n"
+    )
+
+    assert resume_against([httpx.Response(503), httpx.Response(502), sse]) == (json.dumps(result), 3)
+    assert resume_against([httpx.Response(404), sse]) == (None, 1)
+
+
+def test_resume_ignores_json_that_is_not_an_object():
+    responses = [
+        httpx.Response(200, json=[{"id": 2, "result": {}}]),
+        httpx.Response(200, headers={"content-type": "text/event-stream"}, text="id: 1\ndata: [2]\n\n"),
+        httpx.Response(404),
+    ]
+    assert resume_against(responses) == (None, 3)
@@ -0,0 +1,79 @@
+import asyncio
+import json
+
+from file_store import SegmentFileEventStore
+
+from events import replay, store_in_new_session
+
+
+def test_forged_location_of_another_session_does_not_resolve(tmp_path):
+    async def main():
+        store = SegmentFileEventStore(tmp_path, replay_scope="session")
+        try:
+            ids_a = await store_in_new_session(store, "1", range(3))
+            ids_b = await store_in_new_session(store, "1", range(100, 103))
+
+            stream_id, sent = await replay(store, ids_b[0])
+            assert stream_id == "1"
+            assert [event.event_id for event in sent] == ids_b[1:]
+
+            # Records are appended back to back, so A can compute where B's events sit
+            offsets = [int(event_id.split("-")[2]) for event_id in ids_a]
+            token_a, segment, _ = ids_a[-1].split("-")
+            forged = f"{token_a}-{segment}-{offsets[-1] + offsets[1] - offsets[0]}"
+            assert forged.split("-", 1)[1] == ids_b[0].split("-", 1)[1]
+            assert await replay(store, forged) == (None, [])
+
+            # Without any token, or with a non-ASCII one, nothing resolves either
+            for event_id in (ids_b[0].split("-", 1)[1], "é-" + ids_b[0].split("-", 1)[1]):
+                assert await replay(store, event_id) == (None, [])
+        finally:
+            store.close()
+
+    asyncio.run(main())
+
+
+def test_event_ids_survive_a_restart(tmp_path):
+    async def main():
+        store = SegmentFileEventStore(tmp_path)
+        try:
+            ids = await store_in_new_session(store, "1", range(3))
+        finally:
+            store.close()
+
+        # The tokens are derived again from the session keys kept in the segments
+        reopened = SegmentFileEventStore(tmp_path)
+        try:
+            stream_id, sent = await replay(reopened, ids[0])
+            assert stream_id == "1"
+            assert [event.event_id for event in sent] == ids[1:]
+        finally:
+            reopened.close()
+
+    asyncio.run(main())
+
+
+def test_replay_reads_the_active_segment_without_mapping_it(tmp_path):
+    async def main():
+        store = SegmentFileEventStore(tmp_path, segment_max_bytes=1024)
+        try:
+            ids = await store_in_new_session(store, "1", range(40))
+            assert len(store.segments) > 1
+
+            stream_id, sent = await replay(store, ids[0])
+            assert stream_id == "1"
+            assert [event.event_id for event in sent] == ids[1:]
+            assert [json.loads(event.message.model_dump_json())["params"]["data"] for event in sent] == list(range(1, 40))
+
+            # Sealed segments were mapped for the replay; the growing one was read in place
+            active = store.segments[max(store.segments)]
+            assert active.view is None and active.fd is not None
+            assert all(
+                segment.view is not None and segment.fd is None
+                for segment in store.segments.values()
+                if segment is not active
+            )
+        finally:
+            store.close()
+
+    asyncio.run(main())
@@ -0,0 +1,235 @@
+import asyncio
+import json
+
+from mcp.server.streamable_http import EventMessage
+from mcp.types import JSONRPCMessage, JSONRPCNotification
+
+from memory_store import RESYNC_REQUIRED, InMemoryEventStore
+
+from events import notification, progress, replay, store_in_new_session, store_messages_in_new_session
+
+
+def sent_params(sent) -> list[dict]:
+    return [json.loads(event.message.model_dump_json())["params"] for event in sent]
+
+
+def test_own_event_id_replays_the_rest_of_the_stream():
+    async def main():
+        store = InMemoryEventStore()
+        ids = await store_in_new_session(store, "1", range(3))
+
+        stream_id, sent = await replay(store, ids[0])
+        assert stream_id == "1"
+        assert [event.event_id for event in sent] == ids[1:]
+
+    asyncio.run(main())
+
+
+def test_forged_id_of_another_session_does_not_resolve():
+    async def main():
+        store = InMemoryEventStore(replay_scope="session")
+        ids_a = await store_in_new_session(store, "1", range(3))
+        ids_b = await store_in_new_session(store, "1", range(100, 103))
+
+        # Session A knows its own token and can guess that B's stream has the next ordinal
+        token_a, ordinal_a, _ = ids_a[0].split(".")
+        forged = f"{token_a}.{int(ordinal_a, 16) + 1:x}.0"
+        assert await replay(store, forged) == (None, [])
+
+        # Nor does B's own ID resolve with A's token, or A's ID with B's token
+        token_b = ids_b[0].split(".")[0]
+        assert await replay(store, ids_b[0].replace(token_b, token_a)) == (None, [])
+        assert await replay(store, ids_a[0].replace(token_a, token_b)) == (None, [])
+
+    asyncio.run(main())
+
+
+def test_malformed_event_ids_do_not_resolve():
+    async def main():
+        store = InMemoryEventStore()
+        ids = await store_in_new_session(store, "1", range(2))
+        _, ordinal, seq = ids[0].split(".")
+
+        for event_id in ("", "x", "..", f"é.{ordinal}.{seq}", f"{ids[0]}.1", f"zz.{ordinal}.{seq}"):
+            assert await replay(store, event_id) == (None, [])
+
+    asyncio.run(main())
+
+
+def test_byte_budget_evicts_from_the_least_recently_used_stream():
+    async def main():
+        probe = InMemoryEventStore()
+        await store_in_new_session(probe, "1", range(1))
+        event_size = probe.total_bytes
+
+        store = InMemoryEventStore(max_bytes=6 * event_size)
+        ids_a = await store_in_new_session(store, "1", range(3))
+        ids_b = await store_in_new_session(store, "1", range(3))
+        # Replaying A makes it the most recently used stream
+        await replay(store, ids_a[0])
+
+        await store_in_new_session(store, "1", range(1))
+        assert store.total_bytes == 6 * event_size
+        assert store.metrics.evictions == 1
+        assert await replay(store, ids_b[0]) == (None, [])
+        _, sent = await replay(store, ids_a[0])
+        assert [event.event_id for event in sent] == ids_a[1:]
+
+    asyncio.run(main())
+
+
+def test_idle_streams_expire_on_replay():
+    async def main():
+        store = InMemoryEventStore(stream_ttl=0.05)
+        ids = await store_in_new_session(store, "1", range(3))
+
+        await asyncio.sleep(0.1)
+        # No event was stored since, yet the idle stream is gone
+        assert await replay(store, ids[0]) == (None, [])
+        assert store.stats() == {"streams": 0, "events": 0, "bytes": 0, "evicted_events": 3}
+
+    asyncio.run(main())
+
+
+def test_metrics_count_stores_evictions_and_replays():
+    async def main():
+        store = InMemoryEventStore(max_events_per_stream=2)
+        ids = await store_in_new_session(store, "1", range(3))
+        await replay(store, ids[1])
+        await replay(store, ids[0])
+
+        snapshot = store.metrics.snapshot()
+        assert snapshot["events_stored"] == 3
+        assert snapshot["bytes_stored"] == store.total_bytes * 3 // 2
+        assert snapshot["evictions"] == 1
+        # The first event was evicted, so replaying after it is a miss
+        assert snapshot["replay_requests"] == 2 and snapshot["replay_misses"] == 1
+        assert snapshot["events_per_replay_mean"] == 1
+        assert snapshot["events_held"] == 2 and snapshot["streams_held"] == 1
+
+        text = store.metrics.render_prometheus()
+        assert "mcp_event_store_events_stored_total 3\n" in text
+        assert "mcp_event_store_replay_misses_total 1\n" in text
+        assert 'mcp_event_store_replay_events_bucket{le="1"} 1\n' in text
+
+    asyncio.run(main())
+
+
+def test_replay_coalesces_runs_of_progress_for_one_token():
+    async def main():
+        messages = [
+            notification(0),
+            progress("a", 1),
+            progress("a", 2),
+            progress("b", 1),
+            progress("b", 2),
+            notification(1),
+            progress("a", 3),
+            progress("a", 4),
+        ]
+        coalescing = InMemoryEventStore(coalesce_progress=True)
+        ids = await store_messages_in_new_session(coalescing, "1", messages)
+
+        _, sent = await replay(coalescing, ids[0])
+        assert [event.event_id for event in sent] == [ids[2], ids[4], ids[5], ids[7]]
+        assert sent_params(sent)[-1] == {"progressToken": "a", "progress": 4}
+
+        # Without the option every event is sent
+        plain = InMemoryEventStore()
+        ids = await store_messages_in_new_session(plain, "1", messages)
+        _, sent = await replay(plain, ids[0])
+        assert [event.event_id for event in sent] == ids[1:]
+
+    asyncio.run(main())
+
+
+def test_events_above_the_threshold_are_compressed_and_replay_intact():
+    async def main():
+        large = JSONRPCMessage(
+            JSONRPCNotification(jsonrpc="2.0", method="notifications/message", params={"data": "x" * 10_000})
+        )
+        store = InMemoryEventStore(compress_threshold=4096)
+        ids = await store_messages_in_new_session(store, "1", [notification(0), large, notification(1)])
+
+        assert store.metrics.events_compressed == 1
+        assert store.total_bytes < store.metrics.bytes_stored // 10
+        _, sent = await replay(store, ids[0])
+        assert [event.message.model_dump_json() for event in sent] == [
+            large.model_dump_json(by_alias=True, exclude_none=True),
+            notification(1).model_dump_json(by_alias=True, exclude_none=True),
+        ]
+
+        uncompressed = InMemoryEventStore(compress_threshold=None)
+        await store_messages_in_new_session(uncompressed, "1", [large])
+        assert uncompressed.metrics.events_compressed == 0
+        assert uncompressed.total_bytes == uncompressed.metrics.bytes_stored
+
+    asyncio.run(main())
+
+
+def error_of(event) -> dict:
+    return json.loads(event.message.model_dump_json())["error"]
+
+
+def test_backlog_over_the_limit_is_answered_with_resync_required():
+    async def main():
+        store = InMemoryEventStore(max_replay_backlog=3)
+        ids = await store_in_new_session(store, "7", range(6))
+
+        stream_id, sent = await replay(store, ids[0])
+        assert stream_id is None and len(sent) == 1
+        assert sent[0].event_id is None
+        assert json.loads(sent[0].message.model_dump_json())["id"] == 7
+        assert error_of(sent[0])["code"] == RESYNC_REQUIRED
+        assert store.metrics.replay_aborts == {"backlog": 1}
+
+        # A backlog within the limit is replayed as usual
+        _, sent = await replay(store, ids[2])
+        assert [event.event_id for event in sent] == ids[3:]
+
+    asyncio.run(main())
+
+
+def test_events_evicted_during_a_replay_are_answered_with_resync_required():
+    async def main():
+        probe = InMemoryEventStore()
+        await store_in_new_session(probe, "1", range(1))
+
+        store = InMemoryEventStore(max_bytes=4 * probe.total_bytes, send_window=2)
+        ids = await store_in_new_session(store, "7", range(4))
+        sent = []
+
+        async def send_while_another_session_writes(event: EventMessage) -> None:
+            sent.append(event)
+            if len(sent) == 1:
+                # The byte budget evicts the replaying stream before its second window
+                await store_in_new_session(store, "1", range(4))
+
+        assert await store.replay_events_after(ids[0], send_while_another_session_writes) is None
+        assert [event.event_id for event in sent[:2]] == ids[1:3]
+        assert error_of(sent[2])["code"] == RESYNC_REQUIRED
+        assert store.metrics.replay_aborts == {"evicted": 1}
+
+    asyncio.run(main())
+
+
+def test_replay_past_its_deadline_is_cut_off_and_can_be_resumed():
+    async def main():
+        store = InMemoryEventStore(replay_deadline=0.05, send_window=1)
+        ids = await store_in_new_session(store, "7", range(6))
+        sent = []
+
+        async def send_slowly(event: EventMessage) -> None:
+            sent.append(event)
+            await asyncio.sleep(0.02)
+
+        assert await store.replay_events_after(ids[0], send_slowly) is None
+        # The client keeps what it got and resumes from there; no error is sent
+        assert 0 < len(sent) < 5
+        assert [event.event_id for event in sent] == ids[1 : len(sent) + 1]
+        assert store.metrics.replay_aborts == {"deadline": 1}
+
+        _, rest = await replay(store, sent[-1].event_id)
+        assert [event.event_id for event in rest] == ids[len(sent) + 1 :]
+
+    asyncio.run(main())
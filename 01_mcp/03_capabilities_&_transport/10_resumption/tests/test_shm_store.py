@@ -0,0 +1,103 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+from uuid import uuid4
+
+import pytest
+
+from shm_store import SharedMemoryEventStore
+
+from events import replay, store_in_new_session
+
+SMALL_RING = {"index_slots": 4096, "data_size": 1024 * 1024}
+
+
+@pytest.fixture
+def store_name():
+    name = f"mcp_test_{uuid4().hex[:12]}"
+    yield name
+    store = SharedMemoryEventStore(name, **SMALL_RING)
+    store.close()
+    store.unlink()
+
+
+def write_and_wait(name: str, ids: multiprocessing.Queue) -> None:
+    """A worker that stores a session's events, reports their IDs and waits to be killed."""
+
+    async def main() -> list[str]:
+        store = SharedMemoryEventStore(name, **SMALL_RING)
+        return await store_in_new_session(store, "1", range(5))
+
+    ids.put(asyncio.run(main()))
+    signal.pause()
+
+
+def test_resume_on_another_worker_after_the_writer_is_killed(store_name):
+    context = multiprocessing.get_context("spawn")
+    ids = context.Queue()
+    worker = context.Process(target=write_and_wait, args=(store_name, ids))
+    worker.start()
+    try:
+        event_ids = ids.get(timeout=30)
+    finally:
+        os.kill(worker.pid, signal.SIGKILL)
+        worker.join()
+    assert worker.exitcode == -signal.SIGKILL
+
+    async def main():
+        store = SharedMemoryEventStore(store_name, **SMALL_RING)
+        try:
+            stream_id, sent = await replay(store, event_ids[1])
+            assert stream_id == "1"
+            assert [event.event_id for event in sent] == event_ids[2:]
+            assert [json.loads(event.message.model_dump_json())["params"]["data"] for event in sent] == [2, 3, 4]
+        finally:
+            store.close()
+
+    asyncio.run(main())
+
+
+def test_forged_id_of_another_session_does_not_resolve(store_name):
+    async def main():
+        store = SharedMemoryEventStore(store_name, replay_scope="session", **SMALL_RING)
+        try:
+            ids_a = await store_in_new_session(store, "1", range(3))
+            ids_b = await store_in_new_session(store, "1", range(100, 103))
+
+            # Sequence numbers are host-wide, so A can count its way into B's events
+            token_a, epoch, _ = ids_a[-1].split("-")
+            for gseq in range(len(ids_a), len(ids_a) + len(ids_b)):
+                assert await replay(store, f"{token_a}-{epoch}-{gseq:x}") == (None, [])
+            assert await replay(store, "é-" + ids_b[0].split("-", 1)[1]) == (None, [])
+        finally:
+            store.close()
+
+    asyncio.run(main())
+
+
+def test_replay_follows_the_stream_instead_of_scanning(store_name, monkeypatch):
+    async def main():
+        store = SharedMemoryEventStore(store_name, **SMALL_RING)
+        try:
+            ids = await store_in_new_session(store, "1", range(2))
+            # Another session writes far more events after the resuming one
+            await store_in_new_session(store, "1", range(1000))
+
+            lookups = 0
+            entry = store._entry
+
+            def counting_entry(*args):
+                nonlocal lookups
+                lookups += 1
+                return entry(*args)
+
+            monkeypatch.setattr(store, "_entry", counting_entry)
+            _, sent = await replay(store, ids[0])
+            assert [event.event_id for event in sent] == ids[1:]
+            assert lookups == 2
+        finally:
+            store.close()
+
+    asyncio.run(main())
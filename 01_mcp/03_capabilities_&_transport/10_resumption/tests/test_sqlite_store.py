@@ -0,0 +1,113 @@
+import asyncio
+import sqlite3
+
+from sqlite_store import SQLiteEventStore
+
+from events import replay, store_in_new_session
+
+
+def test_failed_commit_keeps_the_batch(tmp_path, monkeypatch):
+    async def main():
+        store = SQLiteEventStore(tmp_path / "events.db")
+        commit = store._commit
+        failures = []
+
+        def commit_once_failing(*args):
+            if not failures:
+                failures.append(args)
+                raise sqlite3.OperationalError("database is locked")
+            return commit(*args)
+
+        monkeypatch.setattr(store, "_commit", commit_once_failing)
+        try:
+            ids = await store_in_new_session(store, "1", range(3))
+            await store.flush()
+            assert failures and len(store._pending) == 3
+
+            # The next flush commits the batch that failed
+            stream_id, sent = await replay(store, ids[0])
+            assert stream_id == "1"
+            assert [event.event_id for event in sent] == ids[1:]
+        finally:
+            store.close()
+
+    asyncio.run(main())
+
+
+def test_batch_that_cannot_be_committed_is_dropped(tmp_path, monkeypatch):
+    async def main():
+        store = SQLiteEventStore(tmp_path / "events.db")
+
+        def commit_failing(*args):
+            raise sqlite3.IntegrityError("UNIQUE constraint failed")
+
+        monkeypatch.setattr(store, "_commit", commit_failing)
+        try:
+            await store_in_new_session(store, "1", range(3))
+            await store.flush()
+            # Retrying would only fail again, so nothing is put back or rescheduled
+            assert store._pending == [] and store._flush_handle is None
+        finally:
+            monkeypatch.undo()
+            store.close()
+
+    asyncio.run(main())
+
+
+def test_event_ids_carry_the_stream_token(tmp_path):
+    async def main():
+        store = SQLiteEventStore(tmp_path / "events.db", replay_scope="session")
+        try:
+            ids_a = await store_in_new_session(store, "1", range(3))
+            ids_b = await store_in_new_session(store, "1", range(100, 103))
+            session_key = store._pending[-1][0]
+            assert not any(session_key in event_id for event_id in ids_a + ids_b)
+
+            _, sent = await replay(store, ids_b[0])
+            assert [event.event_id for event in sent] == ids_b[1:]
+
+            # A's token with the tick of one of B's events does not resolve
+            token_a = ids_a[0].rpartition("-")[0]
+            assert await replay(store, f"{token_a}-{ids_b[0].rpartition('-')[2]}") == (None, [])
+            assert await replay(store, "é-" + ids_b[0].rpartition("-")[2]) == (None, [])
+        finally:
+            store.close()
+
+    asyncio.run(main())
+
+
+def test_counters_of_purged_streams_are_dropped(tmp_path):
+    async def main():
+        store = SQLiteEventStore(tmp_path / "events.db", retention_seconds=0.05)
+        try:
+            await store_in_new_session(store, "1", range(3))
+            await store.flush()
+            assert len(store.next_seq) == 1
+
+            await asyncio.sleep(0.1)
+            ids = await store_in_new_session(store, "2", range(2))
+            await store.flush()
+            # Stream 1 has no events left, so only stream 2 keeps a counter
+            assert [stream_id for _, stream_id in store.next_seq] == ["2"]
+            _, sent = await replay(store, ids[0])
+            assert [event.event_id for event in sent] == ids[1:]
+        finally:
+            store.close()
+
+    asyncio.run(main())
+
+
+def test_close_commits_buffered_events(tmp_path):
+    async def main():
+        store = SQLiteEventStore(tmp_path / "events.db")
+        ids = await store_in_new_session(store, "1", range(2))
+        store.close()
+
+        reopened = SQLiteEventStore(tmp_path / "events.db")
+        try:
+            _, sent = await replay(reopened, ids[0])
+            assert [event.event_id for event in sent] == ids[1:]
+        finally:
+            reopened.close()
+
+    asyncio.run(main())